@@ -10,13 +10,17 @@ st.set_page_config(
 import os
 import pandas as pd
 import numpy as np
-import plotly.express as px
 import plotly.graph_objects as go
 
-from utils import load_excel_file
+from utils import default_workbook_cache, load_excel_file
 from dcf_analyzer import DCFAnalyzer
 from advanced_visualizations import AdvancedVisualizations
-from monte_carlo import run_monte_carlo
+from monte_carlo import (
+    run_monte_carlo_multi_horizon, run_monte_carlo_adaptive,
+    run_reweightable_monte_carlo, run_reweightable_monte_carlo_multi_horizon, histogram_edges, default_result_cache, MonteCarloJob,
+    run_valuation_monte_carlo, run_calibration_backtest, load_returns, PEER_TICKERS, BACKTEST_MODELS,
+    RETURN_MODELS, available_variance_reduction
+)
 from generate_report import generate_html_report
 
 
@@ -62,6 +66,300 @@ div.stButton > button:hover {{ background-color: #1565C0; color: white; }}
 </style>
 """, unsafe_allow_html=True)
 
+# ------------------ MONTE CARLO ------------------
+MC_HORIZON_MIN, MC_HORIZON_MAX, MC_HORIZON_STEP, MC_HORIZON_DEFAULT = 30, 365, 10, 252
+# Every value the horizon slider can take (its default and max sit off the step grid)
+MC_HORIZONS = sorted(set(range(MC_HORIZON_MIN, MC_HORIZON_MAX + 1, MC_HORIZON_STEP)) | {MC_HORIZON_DEFAULT, MC_HORIZON_MAX})
+# Fixed-size runs use a fixed seed, so repeated settings (in any session) come from the result cache
+MC_SEED = 0
+# Paths kept for the drift / volatility knobs (final price plus two sums per path)
+MC_SENSITIVITY_PATHS = 50_000
+# Return series whose sensitivity base paths (~43 MB each) are kept in memory at once
+MC_SENSITIVITY_CACHE_ENTRIES = 4
+TRADING_DAYS = 252
+
+def display_monte_carlo_horizon(by_horizon, horizon, initial_price, dcf_variables):
+    """Show one horizon of a multi-horizon run, with the fan chart cut from the longest checkpoint"""
+    longest = by_horizon[max(by_horizon)]
+    fan = longest.fan_chart().loc[:horizon] if longest.path_sketch is not None else None
+    display_monte_carlo_results(by_horizon[horizon], initial_price, dcf_variables, fan)
+
+@st.fragment(run_every=0.5)
+def monte_carlo_job_progress(horizon, initial_price, dcf_variables):
+    """
+    Poll the session's background Monte Carlo job: show its partial results and a cancel
+    button while it runs, then move the final (or cancelled) result into session_state
+    and rerun the whole app.
+    """
+    mc_job = st.session_state.get("mc_job")
+    if mc_job is None:
+        return
+    job = mc_job["job"]
+    if job.done:
+        del st.session_state["mc_job"]
+        if job.error is not None:
+            st.session_state["mc_results"] = {"settings": mc_job["settings"], "error": str(job.error)}
+        else:
+            by_horizon = job.result if isinstance(job.result, dict) else {mc_job["horizon"]: job.result}
+            st.session_state["mc_results"] = {"settings": mc_job["settings"], "by_horizon": by_horizon}
+        st.rerun(scope="app")
+
+    progress_text = f"Simulating... {job.paths_done:,} paths so far"
+    if job.fraction_done is None:
+        st.write(progress_text)
+    else:
+        st.progress(job.fraction_done, text=progress_text)
+    if st.button("Cancel Simulation"):
+        job.cancel()
+
+    partial = job.snapshot()
+    if partial and horizon in partial:
+        display_monte_carlo_horizon(partial, horizon, initial_price, dcf_variables)
+
+def display_monte_carlo_results(mc_stats, initial_price, dcf_variables, fan=None):
+    """Show the summary statistics, risk metrics, histogram and (optionally) the fan chart of one simulated horizon"""
+    if mc_stats.stop_reason:
+        reached = "target reached" if mc_stats.stop_reason == "target" else f"stopped: {mc_stats.stop_reason.replace('_', ' ')}"
+        st.write(f"Paths Used: {mc_stats.count:,} ({reached})")
+    mc_errors = mc_stats.standard_errors()
+    stats_col, risk_col = st.columns(2)
+    with stats_col:
+        st.write(f"Mean Final Price: £{mc_stats.mean_estimate:.2f} (± £{mc_errors['mean']:.2f} std. error)")
+        st.write(f"Median Final Price: £{mc_stats.median:.2f} (± £{mc_errors['p50']:.2f} std. error)")
+        st.write(f"Max Final Price: £{mc_stats.max:.2f}")
+        st.write(f"Min Final Price: £{mc_stats.min:.2f}")
+
+        price_multiples = dcf_variables.get("share_price_multiples", 0)
+        price_perpetuity = dcf_variables.get("share_price_perpetuity", 0)
+        p_below, _ = mc_stats.probability_below(price_multiples)
+        p_above, _ = mc_stats.probability_above(price_perpetuity)
+        st.write(f"P(Price < DCF Implied Price, Multiples £{price_multiples:.2f}): {p_below:.1%}")
+        st.write(f"P(Price > DCF Implied Price, Perpetuity £{price_perpetuity:.2f}): {p_above:.1%}")
+    with risk_col:
+        st.write("Value at Risk and Expected Shortfall (loss vs. starting price, £)")
+        st.table(mc_stats.risk_metrics(initial_price).style.format("£{:.2f}"))
+
+    bin_centers = 0.5 * (mc_stats.edges[:-1] + mc_stats.edges[1:])
+    fig = go.Figure(go.Bar(x=bin_centers, y=mc_stats.counts, width=np.diff(mc_stats.edges)))
+    fig.update_traces(marker_color="#00BFFF")
+    fig.update_layout(
+        title="Distribution of Final Simulated Prices",
+        title_font_color="#00BFFF",
+        xaxis_title="Final Price",
+        yaxis_title="Number of Simulations",
+        bargap=0,
+        paper_bgcolor=plot_bg,
+        plot_bgcolor=plot_bg,
+        font_color=text_color
+    )
+    fig.update_xaxes(tickfont=dict(color=text_color))
+    fig.update_yaxes(tickfont=dict(color=text_color))
+
+    if fan is None:
+        st.plotly_chart(fig, use_container_width=True)
+        return
+
+    hist_col, fan_col = st.columns(2)
+    with hist_col:
+        st.plotly_chart(fig, use_container_width=True)
+    with fan_col:
+        st.plotly_chart(fan_chart_figure(fan), use_container_width=True)
+
+@st.cache_resource(show_spinner="Simulating the sensitivity base paths...", max_entries=MC_SENSITIVITY_CACHE_ENTRIES)
+def sensitivity_base(returns_array):
+    """
+    Re-weightable base paths at every selectable horizon from a unit starting price,
+    simulated once per return series and server process (see ReweightableSimulation.rescaled)
+    """
+    return run_reweightable_monte_carlo_multi_horizon(returns_array, MC_SENSITIVITY_PATHS, MC_HORIZONS, 1.0, seed=0)
+
+def display_sensitivity(returns_array, horizon, initial_price):
+    """
+    Drift and volatility knobs for the normal model.
+
+    The base paths are simulated once, up to the longest horizon with every horizon's
+    statistics kept and from a unit price scaled to initial_price, and shared by all
+    sessions (sensitivity_base); moving a knob
+    re-weights them by likelihood ratio, and only a knob setting too far away for that
+    (low effective sample size) re-simulates, kept in session_state for that horizon.
+    """
+    key = (horizon, initial_price)
+    base = st.session_state.get("mc_sensitivity")
+    if base is not None and base["key"] == key:
+        simulation = base["simulation"]
+    elif horizon in MC_HORIZONS:
+        simulation = sensitivity_base(returns_array)[horizon].rescaled(initial_price)
+    else:
+        simulation = run_reweightable_monte_carlo(returns_array, MC_SENSITIVITY_PATHS, horizon, initial_price, seed=0)
+        st.session_state["mc_sensitivity"] = {"key": key, "simulation": simulation}
+
+    fitted_drift = simulation.mu * TRADING_DAYS * 100
+    fitted_vol = simulation.sigma * np.sqrt(TRADING_DAYS) * 100
+    drift_col, vol_col = st.columns(2)
+    with drift_col:
+        drift = st.slider("Annual Drift (%)", -100.0, 100.0, float(round(fitted_drift, 1)), 0.5)
+    with vol_col:
+        vol = st.slider("Annual Volatility (%)", 5.0, 100.0, float(round(fitted_vol, 1)), 0.5)
+
+    mu, sigma = drift / 100 / TRADING_DAYS, vol / 100 / np.sqrt(TRADING_DAYS)
+    simulation, weights, resimulated = simulation.at(mu, sigma)
+    if resimulated:
+        # Re-weight from the new paths next time, since they sit where the knobs are now
+        st.session_state["mc_sensitivity"] = {"key": key, "simulation": simulation}
+    summary = simulation.summary(weights)
+
+    st.write(f"Mean Final Price: £{summary['mean']:.2f} | 5th / 50th / 95th Percentile: "
+             f"£{summary['p5']:.2f} / £{summary['p50']:.2f} / £{summary['p95']:.2f}")
+    st.write(f"Effective Sample Size: {summary['effective_sample_size']:,.0f} of {simulation.count:,} paths"
+             + (" (re-simulated at these settings)" if resimulated else " (re-weighted)"))
+
+    edges = histogram_edges(mu, sigma, horizon, initial_price, bins=100)
+    bin_centers = 0.5 * (edges[:-1] + edges[1:])
+    fig = go.Figure(go.Bar(x=bin_centers, y=simulation.histogram(weights, edges), width=np.diff(edges)))
+    fig.update_traces(marker_color="#00BFFF")
+    fig.update_layout(
+        title="Final Price Distribution at the Chosen Drift / Volatility",
+        title_font_color="#00BFFF",
+        xaxis_title="Final Price",
+        yaxis_title="Weighted Number of Simulations",
+        bargap=0,
+        paper_bgcolor=plot_bg,
+        plot_bgcolor=plot_bg,
+        font_color=text_color
+    )
+    fig.update_xaxes(tickfont=dict(color=text_color))
+    fig.update_yaxes(tickfont=dict(color=text_color))
+    st.plotly_chart(fig, use_container_width=True)
+
+def display_valuation_simulation(dcf_analyzer):
+    """Distribution of the DCF share price when WACC, terminal growth and the FCF forecast are uncertain"""
+    cash_flow_inputs = dcf_analyzer.extract_cash_flow_inputs()
+    if cash_flow_inputs is None:
+        st.info("The DCF tab has no free cash flow forecast rows or diluted share count to simulate from.")
+        return
+
+    wacc_col, growth_col, fcf_col = st.columns(3)
+    with wacc_col:
+        wacc_mean = st.number_input("WACC Mean (%)", value=round(cash_flow_inputs["wacc"] * 100, 2), step=0.25)
+        wacc_std = st.number_input("WACC Std. Dev. (%)", min_value=0.0, value=1.0, step=0.1)
+    with growth_col:
+        growth_mean = st.number_input("Terminal Growth Mean (%)", value=round(cash_flow_inputs["terminal_growth"] * 100, 2),
+                                      step=0.25)
+        growth_std = st.number_input("Terminal Growth Std. Dev. (%)", min_value=0.0, value=0.5, step=0.1)
+    with fcf_col:
+        fcf_std = st.number_input("FCF Forecast Uncertainty (± %)", min_value=0.0, value=10.0, step=1.0)
+        wacc_growth_corr = st.slider("WACC / Growth Correlation", -0.9, 0.9, 0.3, 0.1)
+    n_scenarios = st.select_slider("Scenarios", [10_000, 100_000, 1_000_000], value=100_000)
+
+    correlation = np.eye(3)
+    correlation[0, 1] = correlation[1, 0] = wacc_growth_corr
+    valuation = run_valuation_monte_carlo(
+        cash_flow_inputs,
+        {
+            "wacc": ("normal", wacc_mean / 100, wacc_std / 100),
+            "terminal_growth": ("normal", growth_mean / 100, growth_std / 100),
+            "fcf_scale": ("lognormal", 1.0, fcf_std / 100),
+        },
+        correlation, n_scenarios, seed=0
+    )
+    prices = valuation["share_prices"]
+    if prices.size == 0:
+        st.warning("Terminal growth exceeds WACC in every scenario; no intrinsic value can be computed.")
+        return
+
+    p5, p50, p95 = np.percentile(prices, [5, 50, 95])
+    current_price = dcf_analyzer.variables.get("current_share_price", 0)
+    st.write(f"Intrinsic Value 5th / 50th / 95th Percentile: £{p5:.2f} / £{p50:.2f} / £{p95:.2f}")
+    st.write(f"P(Intrinsic Value > Current Price £{current_price:.2f}): {np.mean(prices > current_price):.1%}")
+    if valuation["valid_fraction"] < 1:
+        st.write(f"Scenarios dropped because growth ≥ WACC: {1 - valuation['valid_fraction']:.2%}")
+
+    low, high = np.percentile(prices, [0.5, 99.5])
+    counts, edges = np.histogram(prices, bins=100, range=(low, high))
+    fig = go.Figure(go.Bar(x=0.5 * (edges[:-1] + edges[1:]), y=counts, width=np.diff(edges)))
+    fig.update_traces(marker_color="#FFC107")
+    fig.add_vline(x=current_price, line_color="#00BFFF", annotation_text="Current Price")
+    fig.update_layout(
+        title="Distribution of DCF Implied Share Price",
+        title_font_color="#00BFFF",
+        xaxis_title="Implied Share Price (£)",
+        yaxis_title="Number of Scenarios",
+        bargap=0,
+        paper_bgcolor=plot_bg,
+        plot_bgcolor=plot_bg,
+        font_color=text_color
+    )
+    fig.update_xaxes(tickfont=dict(color=text_color))
+    fig.update_yaxes(tickfont=dict(color=text_color))
+    st.plotly_chart(fig, use_container_width=True)
+
+def display_calibration_backtest():
+    """Rolling-origin PIT histogram and interval coverage of the simulator for one ticker"""
+    ticker_col, model_col, horizon_col = st.columns(3)
+    with ticker_col:
+        ticker = st.selectbox("Ticker", PEER_TICKERS)
+    with model_col:
+        model = st.selectbox("Backtest Model", BACKTEST_MODELS, format_func=RETURN_MODELS.get)
+    with horizon_col:
+        bt_horizon = st.number_input("Forecast Horizon (Days)", min_value=1, max_value=126, value=21)
+    bt_settings = (ticker, model, bt_horizon)
+
+    if st.button("Run Calibration Backtest"):
+        st.session_state["mc_backtest"] = {
+            "settings": bt_settings,
+            "result": run_calibration_backtest(load_returns(ticker), horizon=bt_horizon, model=model, seed=0),
+        }
+    backtest = st.session_state.get("mc_backtest")
+    if not backtest or backtest["settings"] != bt_settings:
+        return
+
+    result = backtest["result"]
+    st.write(f"{len(result['pit']):,} rolling origins, each fitted on the previous 252 days")
+    hist_col, coverage_col = st.columns([2, 1])
+    with hist_col:
+        histogram = result["pit_histogram"]
+        labels = [f"{interval.left:.1f}-{interval.right:.1f}" for interval in histogram.index]
+        fig = go.Figure(go.Bar(x=labels, y=histogram["Observed"], marker_color="#00BFFF", name="Observed"))
+        fig.add_trace(go.Scatter(x=labels, y=histogram["Expected"], mode="lines", name="Calibrated",
+                                 line=dict(color="#FFA500", dash="dash")))
+        fig.update_layout(
+            title="PIT Histogram (flat = calibrated)",
+            title_font_color="#00BFFF",
+            xaxis_title="Realised Price Quantile in Simulated Distribution",
+            yaxis_title="Number of Origins",
+            paper_bgcolor=plot_bg,
+            plot_bgcolor=plot_bg,
+            font_color=text_color
+        )
+        st.plotly_chart(fig, use_container_width=True)
+    with coverage_col:
+        st.write("Prediction Interval Coverage")
+        st.table(result["coverage"].style.format("{:.1%}"))
+
+def fan_chart_figure(fan):
+    """Percentile bands of the simulated price paths over time (columns 5/25/50/75/95)"""
+    days = fan.index
+    fig_fan = go.Figure()
+    for low, high, opacity in [(5, 95, 0.2), (25, 75, 0.4)]:
+        fig_fan.add_trace(go.Scatter(x=days, y=fan[high], line=dict(width=0), showlegend=False, hoverinfo="skip"))
+        fig_fan.add_trace(go.Scatter(
+            x=days, y=fan[low], line=dict(width=0), fill="tonexty",
+            fillcolor=f"rgba(0,191,255,{opacity})", name=f"{low}th-{high}th percentile"
+        ))
+    fig_fan.add_trace(go.Scatter(x=days, y=fan[50], line=dict(color="#FFA500", width=2), name="Median"))
+    fig_fan.update_layout(
+        title="Fan Chart of Simulated Price Paths",
+        title_font_color="#00BFFF",
+        xaxis_title="Day",
+        yaxis_title="Price (£)",
+        paper_bgcolor=plot_bg,
+        plot_bgcolor=plot_bg,
+        font_color=text_color
+    )
+    fig_fan.update_xaxes(tickfont=dict(color=text_color))
+    fig_fan.update_yaxes(tickfont=dict(color=text_color))
+    return fig_fan
+
 # ------------------ MAIN APP ------------------
 def main():
     EXCEL_PATH = "attached_assets/EasyJet- complete.xlsx"
@@ -70,7 +368,7 @@ def main():
 
     if os.path.exists(EXCEL_PATH):
         try:
-            df_dict, _ = load_excel_file(EXCEL_PATH)
+            df_dict, _ = load_excel_file(EXCEL_PATH, cache=default_workbook_cache())
             if 'DCF' not in df_dict:
                 st.error("The Excel file does not contain a 'DCF' tab.")
                 return
@@ -84,7 +382,7 @@ def main():
         uploaded_file = st.file_uploader("Upload Excel file", type=["xlsx", "xls"])
         if uploaded_file:
             try:
-                df_dict, _ = load_excel_file(uploaded_file)
+                df_dict, _ = load_excel_file(uploaded_file, cache=default_workbook_cache())
                 if 'DCF' not in df_dict:
                     st.error("The uploaded file does not contain a 'DCF' tab.")
                     return
@@ -232,30 +530,85 @@ def main():
         default_price = dcf_analyzer.variables.get("current_share_price", 1.0) if dcf_analyzer else 1.0
 
         if returns_array is not None:
-            n_sims = st.slider("Number of Simulations", 100, 5000, 1000, 100)
-            horizon = st.slider("Simulation Horizon (Days)", 30, 365, 252, 10)
+            sizing = st.radio("Simulation Size", ["Fixed number of paths", "Target precision"], horizontal=True)
+            if sizing == "Fixed number of paths":
+                n_sims = st.slider("Number of Simulations", 100, 5000, 1000, 100)
+            else:
+                target_mean_error = st.number_input(
+                    "Target precision on the mean (± £, 95% confidence)",
+                    min_value=0.001, value=0.01, step=0.005, format="%.3f"
+                )
+                target_p5_error = st.number_input(
+                    "Target precision on the 5th percentile (± %, 0 = off)",
+                    min_value=0.0, value=0.0, step=0.5
+                )
+            horizon = st.slider("Simulation Horizon (Days)", MC_HORIZON_MIN, MC_HORIZON_MAX, MC_HORIZON_DEFAULT, MC_HORIZON_STEP)
             initial_price = st.number_input("Starting Price", value=float(default_price))
+            mc_model = st.selectbox(
+                "Return Model",
+                list(RETURN_MODELS),
+                format_func=RETURN_MODELS.get
+            )
+            variance_reduction_options = available_variance_reduction()
+            variance_reduction = st.multiselect(
+                "Variance Reduction",
+                list(variance_reduction_options),
+                format_func=variance_reduction_options.get,
+                help="Reach the same precision with fewer paths (normal model only)"
+            ) if mc_model == "normal" else []
+
+            dcf_variables = dcf_analyzer.variables if dcf_analyzer else {}
+            mc_thresholds = (dcf_variables.get("share_price_multiples", 0), dcf_variables.get("share_price_perpetuity", 0))
+
+            # A fixed-size run records every slider horizon at once, so moving the
+            # horizon slider afterwards just picks another cached checkpoint
+            if sizing == "Fixed number of paths":
+                mc_settings = (sizing, n_sims, initial_price, mc_model, tuple(variance_reduction), mc_thresholds)
+            else:
+                mc_settings = (sizing, target_mean_error, target_p5_error, horizon, initial_price, mc_model,
+                               tuple(variance_reduction), mc_thresholds)
 
+            # Simulations run on a background thread tied to this session, so widget changes
+            # and reruns (e.g. the theme toggle) neither block on nor restart them
             if st.button("Run Monte Carlo Simulation"):
-                final_prices = run_monte_carlo(returns_array, n_sims, horizon, initial_price)
-                st.write(f"Mean Final Price: £{np.mean(final_prices):.2f}")
-                st.write(f"Median Final Price: £{np.median(final_prices):.2f}")
-                st.write(f"Max Final Price: £{max(final_prices):.2f}")
-                st.write(f"Min Final Price: £{min(final_prices):.2f}")
-
-                df_prices = pd.DataFrame({"Final Price": final_prices})
-                fig = px.histogram(df_prices, x="Final Price", nbins=50, title="Distribution of Final Simulated Prices")
-                fig.update_traces(marker_color="#00BFFF")
-                fig.update_layout(
-                    title_font_color="#00BFFF",
-                    yaxis_title="Number of Simulations",
-                    paper_bgcolor=plot_bg,
-                    plot_bgcolor=plot_bg,
-                    font_color=text_color
-                )
-                fig.update_xaxes(tickfont=dict(color=text_color))
-                fig.update_yaxes(tickfont=dict(color=text_color))
-                st.plotly_chart(fig, use_container_width=True)
+                previous = st.session_state.get("mc_job")
+                if previous is not None:
+                    previous["job"].cancel()
+                if sizing == "Fixed number of paths":
+                    job = MonteCarloJob(
+                        run_monte_carlo_multi_horizon, returns_array, n_sims, MC_HORIZONS, initial_price, bins=100,
+                        model=mc_model, variance_reduction=variance_reduction, fan_chart=True,
+                        thresholds=mc_thresholds, seed=MC_SEED, cache=default_result_cache(), total_paths=n_sims
+                    )
+                else:
+                    job = MonteCarloJob(
+                        run_monte_carlo_adaptive, returns_array, horizon, initial_price,
+                        target_mean_error=target_mean_error,
+                        target_percentile_error=target_p5_error / 100 if target_p5_error else None,
+                        bins=100, model=mc_model, variance_reduction=variance_reduction, fan_chart=True,
+                        thresholds=mc_thresholds
+                    )
+                st.session_state["mc_job"] = {"settings": mc_settings, "horizon": horizon, "job": job}
+
+            mc_results = st.session_state.get("mc_results")
+            if "mc_job" in st.session_state:
+                monte_carlo_job_progress(horizon, initial_price, dcf_variables)
+            elif mc_results and "error" in mc_results:
+                st.error(f"Monte Carlo simulation failed: {mc_results['error']}")
+            elif mc_results and mc_results["settings"] == mc_settings and horizon in mc_results["by_horizon"]:
+                display_monte_carlo_horizon(mc_results["by_horizon"], horizon, initial_price, dcf_variables)
+            elif mc_results:
+                st.info("Simulation settings changed. Run the simulation again to update the results.")
+
+            st.markdown("### Drift and Volatility Sensitivity")
+            display_sensitivity(returns_array, horizon, initial_price)
+
+        if dcf_analyzer:
+            st.markdown("### Intrinsic Value Simulation (DCF Inputs)")
+            display_valuation_simulation(dcf_analyzer)
+
+        with st.expander("Calibration Backtest"):
+            display_calibration_backtest()
 
     # Tab 4: Report
     with main_tab4:
@@ -5,6 +5,24 @@ import plotly.graph_objects as go
 import streamlit as st
 from datetime import datetime
 
+from utils import DCF_EXTRACTOR, DCF_FALLBACK_VARIABLES, label_index, parse_numeric
+
+def read_dcf_variables(source):
+    """
+    Read the DCF variables straight from a workbook, without parsing it into DataFrames
+
+    Streams only the cells of utils.DCF_SCHEMA from the DCF tab (see utils.read_cells), so
+    it takes a few milliseconds per workbook; DCF_EXTRACTOR.extract_many does the same
+    for many versions of the model at once.
+
+    Args:
+        source: Path or file object of the .xlsx workbook
+
+    Returns:
+        dict: The same variables as DCFAnalyzer.variables
+    """
+    return DCF_EXTRACTOR.extract(source, sheet_name="DCF")
+
 class DCFAnalyzer:
     """
     A class to extract and visualize DCF model data from an Excel file.
@@ -47,144 +65,68 @@ class DCFAnalyzer:
 
     def _extract_dcf_variables(self):
         """
-        Extract DCF variables from specific cells in the DataFrame
+        Extract DCF variables from specific cells in the DataFrame (utils.DCF_SCHEMA)
 
         Returns:
             dict: Dictionary of extracted DCF variables
         """
         try:
-            # Attempt direct indexing first
-            try:
-                wacc = self._extract_numeric_value(15, 4)
-                terminal_growth = self._extract_numeric_value(17, 10)
-                valuation_date = self._extract_date_value(9, 4)
-                current_share_price = self._extract_numeric_value(12, 4)
-                diluted_shares_outstanding = self._extract_numeric_value(13, 4)
-                ev_multiples = self._extract_numeric_value(22, 10)
-                ev_perpetuity = self._extract_numeric_value(22, 15)
-                share_price_multiples = self._extract_numeric_value(37, 10)
-                share_price_perpetuity = self._extract_numeric_value(37, 15)
-            except Exception as e:
-                st.warning(f"Attempting alternative cell extraction method due to: {str(e)}")
-
-                wacc_row = self._locate_row_with_text("Discount Rate (WACC)")
-                terminal_growth_row = self._locate_row_with_text("Implied Terminal FCF Growth Rate")
-                valuation_date_row = self._locate_row_with_text("Valuation Date")
-                share_price_row = self._locate_row_with_text("Current Share Price")
-                shares_outstanding_row = self._locate_row_with_text("Diluted Shares Outstanding")
-                ev_row = self._locate_row_with_text("Implied Enterprise Value")
-                implied_share_row = self._locate_row_with_text("Implied Share Price")
-
-                wacc = self._extract_numeric_from_row(wacc_row, 4) if wacc_row is not None else 0.1
-                terminal_growth = self._extract_numeric_from_row(terminal_growth_row, 10) if terminal_growth_row is not None else 0.02
-                valuation_date = self._extract_date_from_row(valuation_date_row, 4) if valuation_date_row is not None else datetime.now().strftime("%Y-%m-%d")
-                current_share_price = self._extract_numeric_from_row(share_price_row, 4) if share_price_row is not None else 0
-                diluted_shares_outstanding = self._extract_numeric_from_row(shares_outstanding_row, 4) if shares_outstanding_row is not None else 0
-                ev_multiples = self._extract_numeric_from_row(ev_row, 10) if ev_row is not None else 0
-                ev_perpetuity = self._extract_numeric_from_row(ev_row, 15) if ev_row is not None else 0
-                share_price_multiples = self._extract_numeric_from_row(implied_share_row, 10) if implied_share_row is not None else 0
-                share_price_perpetuity = self._extract_numeric_from_row(implied_share_row, 15) if implied_share_row is not None else 0
-
-            # Ensure we never store None
-            if wacc is None:
-                wacc = 0.1
-            if terminal_growth is None:
-                terminal_growth = 0.02
-            if current_share_price is None:
-                current_share_price = 0
-            if diluted_shares_outstanding is None:
-                diluted_shares_outstanding = 0
-            if ev_multiples is None:
-                ev_multiples = 0
-            if ev_perpetuity is None:
-                ev_perpetuity = 0
-            if share_price_multiples is None:
-                share_price_multiples = 0
-            if share_price_perpetuity is None:
-                share_price_perpetuity = 0
-
-            return {
-                "wacc": wacc,
-                "terminal_growth": terminal_growth,
-                "valuation_date": valuation_date,
-                "current_share_price": current_share_price,
-                "diluted_shares_outstanding": diluted_shares_outstanding,
-                "ev_multiples": ev_multiples,
-                "ev_perpetuity": ev_perpetuity,
-                "share_price_multiples": share_price_multiples,
-                "share_price_perpetuity": share_price_perpetuity
-            }
+            return DCF_EXTRACTOR.extract(self.df)
         except Exception as e:
             st.error(f"Error extracting DCF variables: {str(e)}")
-            return {
-                "wacc": 0.1,
-                "terminal_growth": 0.02,
-                "valuation_date": datetime.now().strftime("%Y-%m-%d"),
-                "current_share_price": 5.0,
-                "diluted_shares_outstanding": 1000,
-                "ev_multiples": 5000,
-                "ev_perpetuity": 5500,
-                "share_price_multiples": 6.0,
-                "share_price_perpetuity": 6.5
-            }
+            return dict(DCF_FALLBACK_VARIABLES, valuation_date=datetime.now().strftime("%Y-%m-%d"))
+
+    def extract_cash_flow_inputs(self):
+        """
+        Extract the inputs of the perpetuity growth DCF from the forecast rows of the DCF tab
+
+        Returns:
+            dict: 'ufcf' and 'discount_periods' (mid-year, in years) per forecast column,
+            'terminal_growth' (baseline terminal FCF growth rate), 'equity_bridge'
+            (implied equity value minus enterprise value, £M), 'diluted_shares_outstanding'
+            and 'wacc'; None if the forecast rows can't be found or there are no diluted
+            shares to spread the equity value over
+        """
+        ufcf_row = self._locate_row_with_text("Unlevered Free Cash Flow for Remainder")
+        period_row = self._locate_row_with_text("Mid-Year Discount Period")
+        growth_row = self._locate_row_with_text("Baseline Terminal FCF Growth Rate")
+        ev_row = self._locate_row_with_text("Implied Enterprise Value")
+        equity_row = self._locate_row_with_text("Implied Equity Value")
+        if ufcf_row is None or period_row is None:
+            return None
+        if not self.variables["diluted_shares_outstanding"] > 0:
+            return None
+
+        ufcf = pd.to_numeric(self.df.iloc[ufcf_row, 4:], errors="coerce")
+        periods = pd.to_numeric(self.df.iloc[period_row, 4:], errors="coerce")
+        forecast = ufcf.notna() & periods.notna()
+        if not forecast.any():
+            return None
+
+        return {
+            "ufcf": ufcf[forecast].to_numpy(dtype=float),
+            "discount_periods": periods[forecast].to_numpy(dtype=float),
+            "terminal_growth": self._extract_numeric_from_row(growth_row, 15) if growth_row is not None else 0.02,
+            "equity_bridge": self._extract_numeric_from_row(equity_row, 15) - self._extract_numeric_from_row(ev_row, 15),
+            "diluted_shares_outstanding": self.variables["diluted_shares_outstanding"],
+            "wacc": self.variables["wacc"],
+        }
 
     def _extract_numeric_value(self, row, col):
         try:
             value = self.df.iloc[row, col]
         except:
             return 0
-        if pd.isna(value):
-            return 0
-        if isinstance(value, (int, float)):
-            return value
-        if isinstance(value, str):
-            temp = value.replace('$', '').replace('£', '').replace('€', '').replace(',', '')
-            if '%' in temp:
-                temp = temp.replace('%', '')
-                try:
-                    return float(temp) / 100.0
-                except:
-                    return 0
-            else:
-                try:
-                    return float(temp)
-                except:
-                    return 0
-        return 0
-
-    def _extract_date_value(self, row, col):
-        try:
-            value = self.df.iloc[row, col]
-        except:
-            return datetime.now().strftime("%Y-%m-%d")
-        if pd.isna(value):
-            return datetime.now().strftime("%Y-%m-%d")
-        if isinstance(value, (pd.Timestamp, datetime)):
-            return value.strftime("%Y-%m-%d")
-        if isinstance(value, str):
-            try:
-                return pd.to_datetime(value).strftime("%Y-%m-%d")
-            except:
-                return datetime.now().strftime("%Y-%m-%d")
-        return datetime.now().strftime("%Y-%m-%d")
+        return parse_numeric(value)
 
     def _locate_row_with_text(self, text):
-        for i in range(len(self.df)):
-            row_values = self.df.iloc[i].astype(str).str.contains(text, case=False, na=False)
-            if any(row_values):
-                return i
-        return None
+        return label_index(self.df).find_row(text)
 
     def _extract_numeric_from_row(self, row, col):
         if row is None:
             return 0
         return self._extract_numeric_value(row, col)
 
-    def _extract_date_from_row(self, row, col):
-        if row is None:
-            return datetime.now().strftime("%Y-%m-%d")
-        return self._extract_date_value(row, col)
-
     def format_currency(self, value):
         if not value or pd.isna(value):
             return "£0.00"
@@ -0,0 +1,150 @@
+import hashlib
+import os
+import pickle
+import tempfile
+
+import numpy as np
+
+# Default on-disk location and size budget of the caches
+CACHE_ROOT = os.environ.get("EZJ_CACHE_DIR", ".cache")
+DEFAULT_CACHE_BYTES = 256 * 1024 ** 2
+
+def content_key(*parts):
+    """
+    SHA-256 hex digest identifying a combination of inputs.
+
+    numpy arrays contribute their dtype, shape and raw bytes, bytes are used as is,
+    and anything else its repr(), so equal inputs give equal keys across processes.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, np.ndarray):
+            part = np.ascontiguousarray(part)
+            digest.update(f"ndarray{part.dtype.str}{part.shape}".encode())
+            digest.update(part.tobytes())
+        elif isinstance(part, (bytes, bytearray)):
+            digest.update(bytes(part))
+        else:
+            digest.update(repr(part).encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class DiskCache:
+    """
+    Content-addressed pickle cache in one directory, bounded by total size.
+
+    Entries are written to a temporary file and moved into place with os.replace,
+    so another process (e.g. a second Streamlit worker) only ever sees a complete
+    entry or none. A hit refreshes the entry's modification time, and once the
+    directory grows past max_bytes the least recently used entries are deleted.
+    Entries that vanish mid-way are treated as misses, and so are entries that fail
+    to load for any reason (truncated, or written by an incompatible version of the
+    code), which are deleted as well.
+    """
+
+    suffix = ".pkl"
+
+    def __init__(self, directory, max_bytes=DEFAULT_CACHE_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + self.suffix)
+
+    def get(self, key, default=None):
+        path = self._path(key)
+        try:
+            f = open(path, "rb")
+        except OSError:
+            return default
+        try:
+            with f:
+                value = self._load(f)
+        except Exception:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return default
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return value
+
+    def _load(self, f):
+        return pickle.load(f)
+
+    def _dump(self, value, f):
+        pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def __contains__(self, key):
+        return os.path.exists(self._path(key))
+
+    def set(self, key, value):
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                self._dump(value, f)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        self.evict()
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits in max_bytes"""
+        entries = []
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return
+        for name in names:
+            if not name.endswith(self.suffix):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        for name in os.listdir(self.directory) if os.path.isdir(self.directory) else []:
+            if name.endswith(self.suffix):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    pass
+
+
+class NpzCache(DiskCache):
+    """
+    DiskCache whose entries are dicts of numpy arrays stored as uncompressed .npz files.
+
+    Entries are loaded with allow_pickle=False, so only plain numeric, string and
+    datetime arrays can be stored, and reading an entry never executes code.
+    """
+
+    suffix = ".npz"
+
+    def _load(self, f):
+        with np.load(f, allow_pickle=False) as npz:
+            return {name: npz[name] for name in npz.files}
+
+    def _dump(self, value, f):
+        np.savez(f, **value)
@@ -2,6 +2,16 @@ import os
 from datetime import datetime
 import streamlit as st
 
+from monte_carlo import run_monte_carlo_multi_horizon, default_result_cache
+
+# Paths used for the report's price simulation; with antithetic sampling and the
+# control variate this matches the precision of ~10x as many plain paths
+REPORT_SIMULATIONS = 2_000
+REPORT_HORIZON = 252
+# Trading-day checkpoints (1, 3, 6, 9, 12 months) for the term structure of quantiles
+REPORT_CHECKPOINTS = (21, 63, 126, 189, 252)
+REPORT_VARIANCE_REDUCTION = ("antithetic", "control_variate")
+
 def generate_html_report(dcf_analyzer, returns_array):
     """
     Generate an HTML report summarizing key DCF metrics and Monte Carlo stats
@@ -16,6 +26,44 @@ def generate_html_report(dcf_analyzer, returns_array):
     mean_return = f"{returns_array.mean()*100:.2f}%" if returns_array is not None else "N/A"
     volatility = f"{returns_array.std()*100:.2f}%" if returns_array is not None else "N/A"
 
+    if returns_array is not None:
+        mc_by_horizon = run_monte_carlo_multi_horizon(
+            returns_array, REPORT_SIMULATIONS, REPORT_CHECKPOINTS, metrics['current_share_price'],
+            seed=0, variance_reduction=REPORT_VARIANCE_REDUCTION,
+            thresholds=(metrics['share_price_multiples'], metrics['share_price_perpetuity']),
+            cache=default_result_cache()
+        )
+        mc_stats = mc_by_horizon[REPORT_HORIZON]
+        mc_errors = mc_stats.standard_errors()
+        p5, p50, p95 = mc_stats.percentile([5, 50, 95])
+        simulated_mean = f"£{mc_stats.mean_estimate:.2f} (± £{mc_errors['mean']:.2f})"
+        simulated_range = f"£{p5:.2f} / £{p50:.2f} / £{p95:.2f} (± £{mc_errors['p5']:.2f} / £{mc_errors['p50']:.2f} / £{mc_errors['p95']:.2f})"
+        p_below, _ = mc_stats.probability_below(metrics['share_price_multiples'])
+        p_above, _ = mc_stats.probability_above(metrics['share_price_perpetuity'])
+        probability_below = f"{p_below:.1%}"
+        probability_above = f"{p_above:.1%}"
+        risk_rows = "".join(
+            f"<tr><td>{level}</td><td>£{row['VaR']:.2f}</td><td>£{row['Expected Shortfall']:.2f}</td></tr>"
+            for level, row in mc_stats.risk_metrics(metrics['current_share_price']).iterrows()
+        )
+        risk_table = f"""
+            <table class='term-structure'>
+                <tr><th>Confidence</th><th>VaR</th><th>Expected Shortfall</th></tr>
+                {risk_rows}
+            </table>"""
+        term_rows = "".join(
+            f"<tr><td>{h}</td>" + "".join(f"<td>£{p:.2f}</td>" for p in mc_by_horizon[h].percentile([5, 25, 50, 75, 95])) + "</tr>"
+            for h in REPORT_CHECKPOINTS
+        )
+        term_structure = f"""
+            <table class='term-structure'>
+                <tr><th>Days</th><th>5th</th><th>25th</th><th>50th</th><th>75th</th><th>95th</th></tr>
+                {term_rows}
+            </table>"""
+    else:
+        simulated_mean = simulated_range = probability_below = probability_above = "N/A"
+        term_structure = risk_table = "<div class='metric'>N/A</div>"
+
     html_content = f"""
     <!DOCTYPE html>
     <html>
@@ -28,6 +76,7 @@ def generate_html_report(dcf_analyzer, returns_array):
             h2 {{ color: #2980B9; }}
             .section {{ margin-bottom: 30px; }}
             .metric {{ margin-bottom: 10px; }}
+            .term-structure td, .term-structure th {{ padding: 4px 12px; text-align: right; }}
         </style>
     </head>
     <body>
@@ -55,6 +104,19 @@ def generate_html_report(dcf_analyzer, returns_array):
             <h2>Monte Carlo Summary</h2>
             <div class='metric'><b>Mean Daily Return:</b> {mean_return}</div>
             <div class='metric'><b>Volatility:</b> {volatility}</div>
+            <div class='metric'><b>Simulated Price in {REPORT_HORIZON} Days (mean ± std. error):</b> {simulated_mean}</div>
+            <div class='metric'><b>5th / 50th / 95th Percentile:</b> {simulated_range}</div>
+            <div class='metric'><b>Paths Simulated:</b> {REPORT_SIMULATIONS:,} (antithetic + control variate)</div>
+            <div class='metric'><b>Term Structure of Simulated Price Percentiles:</b></div>
+            {term_structure}
+        </div>
+
+        <div class='section'>
+            <h2>Simulated Risk Metrics ({REPORT_HORIZON} Days)</h2>
+            <div class='metric'><b>Value at Risk / Expected Shortfall (loss vs. current price):</b></div>
+            {risk_table}
+            <div class='metric'><b>P(Price &lt; Implied Share Price, Multiples):</b> {probability_below}</div>
+            <div class='metric'><b>P(Price &gt; Implied Share Price, Perpetuity):</b> {probability_above}</div>
         </div>
 
         <p><i>This report is automatically generated from the Streamlit DCF dashboard for EasyJet plc.</i></p>
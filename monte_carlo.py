@@ -1,37 +1,2145 @@
+import hashlib
+import copy
+import importlib.util
+import json
+import math
+import os
+import threading
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from statistics import NormalDist
+
 import numpy as np
 import pandas as pd
 
-def run_monte_carlo(returns_array, n_simulations=1000, horizon=252, initial_price=100):
+from disk_cache import CACHE_ROOT, NpzCache, content_key
+
+try:
+    import numba
+except ImportError:  # optional: path statistics fall back to NumPy
+    numba = None
+
+# Paths simulated per chunk in streaming mode: 10k paths x 252 days of float64 is ~20 MB
+DEFAULT_CHUNK_SIZE = 10_000
+
+# Mean block length (in days) for the stationary block bootstrap
+DEFAULT_BLOCK_LENGTH = 20
+
+# A streaming run is split into at least this many independent chunks so that the
+# spread of the per-chunk estimates gives a standard error (batch means)
+MIN_BATCHES = 10
+
+# Percentiles of the final price whose per-chunk estimates are tracked for standard errors
+TRACKED_PERCENTILES = (1, 5, 50, 95, 99)
+
+# Confidence levels for value at risk and expected shortfall
+RISK_LEVELS = (0.95, 0.99, 0.995)
+
+# Percentile bands of the fan chart and the (smaller) sketch capacity used per day for it
+FAN_CHART_PERCENTILES = (5, 25, 50, 75, 95)
+FAN_SKETCH_CAPACITY = 1024
+
+# Simulation results are cached here between sessions and report builds (see default_result_cache)
+RESULT_CACHE_DIR = os.path.join(CACHE_ROOT, "monte_carlo")
+# Part of every result cache key: bump it whenever a change to the samplers or the statistics
+# would make earlier cached results differ from a fresh run
+RESULT_CACHE_VERSION = 1
+
+VARIANCE_REDUCTION = {
+    "antithetic": "Antithetic variates",
+    "control_variate": "GBM control variate",
+    "sobol": "Scrambled Sobol (quasi-random)",
+}
+
+def available_variance_reduction():
+    """The VARIANCE_REDUCTION options usable here: Sobol sampling needs scipy, which is optional"""
+    if importlib.util.find_spec("scipy") is None:
+        return {key: label for key, label in VARIANCE_REDUCTION.items() if key != "sobol"}
+    return dict(VARIANCE_REDUCTION)
+
+def fit_normal(returns_array):
+    """Return the (mu, sigma) of a normal distribution fitted to the historical returns"""
+    returns_array = np.asarray(returns_array, dtype=float)
+    return np.mean(returns_array), np.std(returns_array)
+
+
+class NormalReturns:
+    """
+    Parametric model: i.i.d. normal returns with the historical mean and volatility.
+
+    Optionally draws antithetic pairs (z, -z) and/or scrambled Sobol points mapped
+    through the normal inverse CDF instead of pseudo-random normals.
+    """
+
+    name = "normal"
+
+    def __init__(self, returns_array, antithetic=False, qmc=False):
+        self.mu, self.sigma = fit_normal(returns_array)
+        self.antithetic = antithetic
+        self.qmc = qmc
+
+    def sample(self, rng, n_paths, horizon):
+        if not (self.antithetic or self.qmc):
+            return rng.normal(self.mu, self.sigma, size=(n_paths, horizon))
+
+        n_draws = (n_paths + 1) // 2 if self.antithetic else n_paths
+        if self.qmc:
+            shocks = _sobol_normals(rng, n_draws, horizon)
+        else:
+            shocks = rng.standard_normal((n_draws, horizon))
+        if self.antithetic:
+            shocks = np.concatenate([shocks, -shocks])[:n_paths]
+
+        shocks *= self.sigma
+        shocks += self.mu
+        return shocks
+
+    def control_variate(self, returns_sum, horizon, initial_price):
+        """
+        GBM terminal price driven by the same shocks as each simulated path.
+
+        Matches the simulated price's mean: with s = sigma / (1 + mu) the control
+        is P0 (1 + mu)^h exp(-h s^2 / 2 + sum(r - mu) / (1 + mu)), whose exact
+        expectation is P0 (1 + mu)^h.
+
+        Parameters:
+        - returns_sum: Sum of each path's simulated returns over the first `horizon` days.
+
+        Returns:
+        - (control values per path, analytic expectation of the control)
+        """
+        growth = 1.0 + self.mu
+        scaled_sigma = self.sigma / growth
+        expected = initial_price * growth ** horizon
+        log_shock = (returns_sum - horizon * self.mu) / growth
+        return expected * np.exp(log_shock - 0.5 * horizon * scaled_sigma ** 2), expected
+
+def _sobol_normals(rng, n_paths, horizon):
+    """(n_paths x horizon) standard normals from a scrambled Sobol sequence seeded by rng"""
+    try:
+        from scipy.special import ndtri
+        from scipy.stats import qmc
+    except ImportError as e:
+        raise ImportError("Sobol sampling requires scipy (pip install scipy)") from e
+
+    sampler = qmc.Sobol(d=horizon, scramble=True, seed=rng)
+    with warnings.catch_warnings():
+        # Partial chunks are not a power of two; they are still valid, just less balanced
+        warnings.simplefilter("ignore", UserWarning)
+        points = sampler.random(n_paths)
+    return ndtri(np.clip(points, 1e-12, 1 - 1e-12))
+
+
+class BootstrapReturns:
     """
-    A placeholder Monte Carlo simulation function that:
+    Resamples the historical returns themselves instead of fitting a distribution.
+
+    With block_length=None every day is drawn independently (i.i.d. bootstrap).
+    Otherwise this is the stationary block bootstrap of Politis & Romano: each day
+    starts a new block with probability 1 / block_length and otherwise continues
+    with the next historical day, which keeps volatility clustering intact.
+    """
+
+    def __init__(self, returns_array, block_length=None):
+        self.returns = np.asarray(returns_array, dtype=float)
+        self.block_length = block_length
+        self.mu, self.sigma = fit_normal(self.returns)
+
+    @property
+    def name(self):
+        return "bootstrap" if self.block_length is None else "block_bootstrap"
+
+    def sample(self, rng, n_paths, horizon):
+        return self.returns[self.sample_indices(rng, n_paths, horizon)]
+
+    def sample_indices(self, rng, n_paths, horizon):
+        """(n_paths x horizon) matrix of indices into the historical returns"""
+        n_obs = self.returns.size
+        if self.block_length is None or self.block_length <= 1:
+            return rng.integers(0, n_obs, size=(n_paths, horizon))
+
+        # Day t restarts a block with probability 1/L; the first day of a path always does
+        restart = rng.random((n_paths, horizon)) < 1.0 / self.block_length
+        restart[:, 0] = True
+        restart = restart.ravel()
+
+        # One random start per block, stored as an offset so index = offset + day
+        block_starts = np.flatnonzero(restart)
+        offsets = rng.integers(0, n_obs, size=block_starts.size) - block_starts % horizon
+        block_id = np.cumsum(restart) - 1
+
+        idx = offsets[block_id].reshape(n_paths, horizon)
+        idx += np.arange(horizon)
+        idx %= n_obs
+        return idx
+
+
+class StudentTReturns:
+    """
+    Parametric model: i.i.d. Student-t log-returns, loc + scale * t(df), fitted by maximum
+    likelihood to log(1 + r).
+
+    sample returns the simple returns exp(x) - 1, which stay above -1 however fat the tails
+    are. mu and sigma are the lognormal-equivalent daily mean and volatility implied by the
+    log-return fit (df > 2).
+    """
+
+    name = "student_t"
+
+    def __init__(self, returns_array):
+        self.loc, self.scale, self.df = fit_student_t(np.log1p(returns_array))
+        self.sigma = self.scale * math.sqrt(self.df / (self.df - 2.0))
+        self.mu = self.loc + 0.5 * self.sigma ** 2
+
+    def sample(self, rng, n_paths, horizon):
+        shocks = rng.standard_t(self.df, size=(n_paths, horizon))
+        shocks *= self.scale
+        shocks += self.loc
+        return np.expm1(shocks, out=shocks)
+
+def fit_student_t(returns_array, min_df=2.05, max_df=200.0, tol=1e-8, max_iter=500):
+    """
+    Maximum likelihood (loc, scale, df) of a Student-t distribution.
+
+    For a given df, loc and scale come from the EM iteration for the t distribution
+    (each observation weighted by (df + 1) / (df + z^2)); df itself is found by a
+    golden-section search on the profile log-likelihood over log(df).
+    """
+    x = np.asarray(returns_array, dtype=float)
+    x = x[np.isfinite(x)]
+
+    def fit_given_df(df, loc, scale):
+        for _ in range(max_iter):
+            z2 = ((x - loc) / scale) ** 2
+            weights = (df + 1.0) / (df + z2)
+            new_loc = np.sum(weights * x) / np.sum(weights)
+            new_scale = math.sqrt(np.mean(weights * (x - new_loc) ** 2))
+            converged = abs(new_loc - loc) < tol * scale and abs(new_scale - scale) < tol * scale
+            loc, scale = new_loc, new_scale
+            if converged:
+                break
+        z2 = ((x - loc) / scale) ** 2
+        log_lik = x.size * (math.lgamma((df + 1) / 2) - math.lgamma(df / 2) - 0.5 * math.log(df * math.pi)
+                            - math.log(scale)) - 0.5 * (df + 1) * np.sum(np.log1p(z2 / df))
+        return log_lik, loc, scale
+
+    # Robust starting point: median and MAD-based scale
+    loc = float(np.median(x))
+    scale = float(1.4826 * np.median(np.abs(x - loc))) or float(np.std(x))
+
+    golden = (math.sqrt(5) - 1) / 2
+    lo, hi = math.log(min_df), math.log(max_df)
+    a, b = hi - golden * (hi - lo), lo + golden * (hi - lo)
+    fa, loc_a, scale_a = fit_given_df(math.exp(a), loc, scale)
+    fb, loc_b, scale_b = fit_given_df(math.exp(b), loc, scale)
+    while hi - lo > 1e-4:
+        if fa > fb:
+            hi, b, fb, loc_b, scale_b = b, a, fa, loc_a, scale_a
+            a = hi - golden * (hi - lo)
+            fa, loc_a, scale_a = fit_given_df(math.exp(a), loc_b, scale_b)
+        else:
+            lo, a, fa, loc_a, scale_a = a, b, fb, loc_b, scale_b
+            b = lo + golden * (hi - lo)
+            fb, loc_b, scale_b = fit_given_df(math.exp(b), loc_a, scale_a)
+    if fa > fb:
+        return float(loc_a), float(scale_a), math.exp(a)
+    return float(loc_b), float(scale_b), math.exp(b)
+
+
+class MertonJumpReturns:
+    """
+    Merton jump-diffusion: a normal daily log-return plus N ~ Poisson(jump_rate) normal jumps.
+
+    log(1 + r) = drift + diffusion_sigma * z + sum of N jumps, each N(jump_mean, jump_sigma^2),
+    fitted to the log-returns, so the simple returns from sample stay above -1. The jumps of
+    a whole (n_paths x horizon) block are drawn in bulk (see sample), and mu and sigma are
+    the lognormal-equivalent daily mean and volatility.
+    """
+
+    name = "merton_jump"
+
+    def __init__(self, returns_array):
+        self.drift, self.diffusion_sigma, self.jump_rate, self.jump_mean, self.jump_sigma = fit_merton_jump(np.log1p(returns_array))
+        self.sigma = math.sqrt(self.diffusion_sigma ** 2 + self.jump_rate * (self.jump_sigma ** 2 + self.jump_mean ** 2))
+        self.mu = self.drift + self.jump_rate * self.jump_mean + 0.5 * self.sigma ** 2
+
+    def sample(self, rng, n_paths, horizon):
+        returns = rng.normal(self.drift, self.diffusion_sigma, size=(n_paths, horizon))
+
+        # Independent Poisson(rate) counts per path-step are the same as a Poisson(rate * cells)
+        # total scattered uniformly over the cells, which only costs draws for the jumps themselves
+        n_jumps = rng.poisson(self.jump_rate * returns.size)
+        cells = rng.integers(0, returns.size, size=n_jumps)
+        np.add.at(returns.reshape(-1), cells, rng.normal(self.jump_mean, self.jump_sigma, size=n_jumps))
+        return np.expm1(returns, out=returns)
+
+def fit_merton_jump(returns_array, tol=1e-10, max_iter=1000):
+    """
+    Calibrate (drift, diffusion_sigma, jump_rate, jump_mean, jump_sigma) to daily returns.
+
+    Daily jump probabilities are small, so the Merton density is approximated by
+    its first two terms (no jump / one jump): a two-component normal mixture
+    fitted by EM. The jump component's extra mean and variance give the jump size
+    distribution and its weight p gives the Poisson rate -log(1 - p).
+
+    Returns:
+    - (drift, diffusion_sigma, jump_rate, jump_mean, jump_sigma)
+    """
+    x = np.asarray(returns_array, dtype=float)
+    x = x[np.isfinite(x)]
+
+    # Start with days beyond 3 robust standard deviations as the jump component
+    median = np.median(x)
+    robust_sigma = 1.4826 * np.median(np.abs(x - median))
+    jump_days = np.abs(x - median) > 3 * robust_sigma
+    p = max(jump_days.mean(), 1.0 / x.size)
+    m0, v0 = median, robust_sigma ** 2
+    m1, v1 = (x[jump_days].mean(), x[jump_days].var() + v0) if jump_days.sum() > 1 else (median, 9 * v0)
+
+    log_lik = -np.inf
+    for _ in range(max_iter):
+        dens0 = (1 - p) * np.exp(-0.5 * (x - m0) ** 2 / v0) / np.sqrt(v0)
+        dens1 = p * np.exp(-0.5 * (x - m1) ** 2 / v1) / np.sqrt(v1)
+        total = dens0 + dens1
+        resp = dens1 / total
+
+        p = resp.mean()
+        w0, w1 = 1 - resp, resp
+        m0 = np.sum(w0 * x) / w0.sum()
+        m1 = np.sum(w1 * x) / w1.sum()
+        v0 = np.sum(w0 * (x - m0) ** 2) / w0.sum()
+        # The jump component is the diffusion plus a jump, so it can't be narrower
+        v1 = max(np.sum(w1 * (x - m1) ** 2) / w1.sum(), v0)
+
+        new_log_lik = np.sum(np.log(total))
+        if new_log_lik - log_lik < tol * abs(new_log_lik):
+            break
+        log_lik = new_log_lik
+
+    return (float(m0), float(np.sqrt(v0)), float(-np.log1p(-p)), float(m1 - m0), float(np.sqrt(v1 - v0)))
+
+
+class GarchReturns:
+    """
+    GARCH(1,1) returns: r_t = mu + eps_t, eps_t = sigma_t z_t,
+    sigma_t^2 = omega + alpha eps_{t-1}^2 + beta sigma_{t-1}^2.
+
+    Parameters come from fit_garch (cached per return series). Every path starts
+    from the one-day-ahead variance forecast at the end of the history, and the
+    recursion runs one day at a time over all paths at once, so a sample costs
+    `horizon` Python iterations whatever the number of paths.
+
+    sigma is the unconditional daily volatility; dtype=np.float32 halves the memory
+    and bandwidth of the simulated block.
+    """
+
+    name = "garch"
+
+    def __init__(self, returns_array, dtype=np.float64):
+        self.mu, self.omega, self.alpha, self.beta, self.last_variance = fit_garch(returns_array)
+        self.sigma = math.sqrt(self.omega / (1.0 - self.alpha - self.beta))
+        self.dtype = np.dtype(dtype)
+
+    def sample(self, rng, n_paths, horizon):
+        # Day-major so each step works on one contiguous row of n_paths shocks
+        shocks = rng.standard_normal((horizon, n_paths), dtype=self.dtype)
+        variance = np.full(n_paths, self.last_variance, dtype=self.dtype)
+        omega, alpha, beta = (self.dtype.type(v) for v in (self.omega, self.alpha, self.beta))
+        for day_shocks in shocks:
+            day_shocks *= np.sqrt(variance)
+            variance *= beta
+            variance += omega
+            variance += alpha * day_shocks ** 2
+        shocks += self.dtype.type(self.mu)
+        return shocks.T
+
+_GARCH_FITS = {}
+
+def fit_garch(returns_array, grid_size=40, n_rounds=4):
+    """
+    Gaussian quasi-maximum likelihood GARCH(1,1) fit, cached by a hash of the return series.
+
+    mu is the sample mean and omega is set by variance targeting
+    (omega = var * (1 - alpha - beta)), leaving (alpha, beta) to a grid search that
+    zooms in around the best point for n_rounds. Each round evaluates the whole
+    grid in a single pass over the history.
+
+    Returns:
+    - (mu, omega, alpha, beta, next-day variance forecast)
+    """
+    x = np.ascontiguousarray(returns_array, dtype=float)
+    x = x[np.isfinite(x)]
+    key = hashlib.sha256(x.tobytes()).hexdigest()
+    if key not in _GARCH_FITS:
+        _GARCH_FITS[key] = _fit_garch(x, grid_size, n_rounds)
+    return _GARCH_FITS[key]
+
+def _fit_garch(x, grid_size, n_rounds):
+    mu = x.mean()
+    eps = x - mu
+    sample_variance = eps.var()
+
+    alpha_lo, alpha_hi, beta_lo, beta_hi = 0.0, 0.5, 0.0, 0.999
+    for _ in range(n_rounds):
+        alpha, beta = np.meshgrid(np.linspace(alpha_lo, alpha_hi, grid_size),
+                                  np.linspace(beta_lo, beta_hi, grid_size), indexing="ij")
+        alpha, beta = alpha.ravel(), beta.ravel()
+        stationary = alpha + beta < 0.9999
+        alpha, beta = alpha[stationary], beta[stationary]
+        omega = sample_variance * (1.0 - alpha - beta)
+
+        variance = np.full(alpha.size, sample_variance)
+        neg_log_lik = np.zeros(alpha.size)
+        for e in eps:
+            neg_log_lik += np.log(variance) + e * e / variance
+            variance = omega + alpha * e * e + beta * variance
+
+        best = np.argmin(neg_log_lik)
+        alpha_step = (alpha_hi - alpha_lo) / (grid_size - 1)
+        beta_step = (beta_hi - beta_lo) / (grid_size - 1)
+        alpha_lo, alpha_hi = max(alpha[best] - 2 * alpha_step, 0.0), alpha[best] + 2 * alpha_step
+        beta_lo, beta_hi = max(beta[best] - 2 * beta_step, 0.0), min(beta[best] + 2 * beta_step, 0.9999)
+
+    a, b, w = float(alpha[best]), float(beta[best]), float(omega[best])
+    return float(mu), w, a, b, float(variance[best])
+
+
+RETURN_MODELS = {
+    "normal": "Normal (fitted mean / volatility)",
+    "student_t": "Student-t (fat tails, MLE fit)",
+    "merton_jump": "Merton jump-diffusion",
+    "garch": "GARCH(1,1) volatility clustering",
+    "bootstrap": "Historical bootstrap",
+    "block_bootstrap": "Stationary block bootstrap",
+}
+
+def build_return_model(returns_array, model="normal", block_length=DEFAULT_BLOCK_LENGTH,
+                       antithetic=False, qmc=False):
+    """
+    Build a return model from the historical returns.
+
+    Parameters:
+    - returns_array: A numpy array (or list) of historical returns.
+    - model: One of the RETURN_MODELS keys, or an already built model (returned as is).
+    - block_length: Mean block length for the 'block_bootstrap' model.
+    - antithetic, qmc: Antithetic / scrambled Sobol sampling (normal model only).
+
+    Returns:
+    - A model object with mu, sigma and sample(rng, n_paths, horizon).
+    """
+    if not isinstance(model, str):
+        return model
+    if model == "normal":
+        return NormalReturns(returns_array, antithetic, qmc)
+    if antithetic or qmc:
+        raise ValueError(f"Antithetic and Sobol sampling need normal shocks, not the {model!r} model")
+    if model == "student_t":
+        return StudentTReturns(returns_array)
+    if model == "merton_jump":
+        return MertonJumpReturns(returns_array)
+    if model == "garch":
+        return GarchReturns(returns_array)
+    if model == "bootstrap":
+        return BootstrapReturns(returns_array)
+    if model == "block_bootstrap":
+        return BootstrapReturns(returns_array, block_length)
+    raise ValueError(f"Unknown return model: {model!r}. Expected one of {list(RETURN_MODELS)}")
+
+def simulate_final_prices(returns_array, n_simulations=1000, horizon=252, initial_price=100, rng=None,
+                          model="normal"):
+    """
+    Batched Monte Carlo engine:
+    1. Builds a return model from the historical returns (normal fit or bootstrap).
+    2. Draws the whole (n_simulations x horizon) matrix of random returns in one call.
+    3. Compounds each row with array operations instead of a per-step Python loop.
+
+    Parameters:
+    - returns_array: A numpy array (or list) of historical returns, e.g., daily percentages.
+    - n_simulations: How many separate simulation paths to run.
+    - horizon: Over how many 'days' (or periods) each simulation runs.
+    - initial_price: The starting price for each simulation.
+    - rng: Optional np.random.Generator; a freshly seeded one is used when omitted.
+    - model: Return model name (see RETURN_MODELS) or model object.
+
+    Returns:
+    - final_prices: A numpy array (length n_simulations) of the final price from each path.
+    """
+    return_model = build_return_model(returns_array, model)
+    return _simulate_chunk(return_model, n_simulations, horizon, initial_price, rng)
+
+def _simulate_chunk(return_model, n_paths, horizon, initial_price, rng=None):
+    if rng is None:
+        rng = np.random.default_rng()
+
+    # One draw for every path and step, then turn returns into growth factors in place
+    growth = return_model.sample(rng, n_paths, horizon)
+    growth += 1.0
+
+    return initial_price * np.prod(growth, axis=1)
+
+def run_monte_carlo(returns_array, n_simulations=1000, horizon=252, initial_price=100, seed=None,
+                    model="normal", cache=None):
+    """
+    Monte Carlo simulation of the share price:
     1. Takes a numpy array of historical returns (daily or weekly).
     2. Simulates random paths for a given horizon (e.g., 252 trading days).
-    3. Returns a list of final simulated prices.
+    3. Returns the final simulated prices.
+
+    Thin wrapper around simulate_final_prices, kept so existing callers
+    (app.py, generate_html_report) don't need to change.
 
     Parameters:
     - returns_array: A numpy array (or list) of historical returns, e.g., daily percentages.
     - n_simulations: How many separate simulation paths to run.
     - horizon: Over how many 'days' (or periods) each simulation runs.
     - initial_price: The starting price for each simulation.
+    - seed: Optional seed (int or np.random.SeedSequence) for reproducible results.
+    - model: Return model name (see RETURN_MODELS) or model object.
+    - cache: Optional NpzCache or DiskCache (e.g. default_result_cache()). Runs with an int seed and a
+      named model are looked up there first and stored after simulating; since this
+      function returns every final price, those are what gets cached.
 
     Returns:
-    - final_prices: A list (length n_simulations) of the final price from each simulation path.
+    - final_prices: A numpy array (length n_simulations) of the final price from each simulation path.
     """
-    # 1) Calculate historical mean (mu) and std (sigma) of returns
-    mu = np.mean(returns_array)
-    sigma = np.std(returns_array)
+    key = _result_key(cache, "final_prices", returns_array, n_simulations, horizon, initial_price, model, seed)
+    if key is not None:
+        cached = cache.get(key)
+        if cached is not None and "final_prices" in cached:
+            return cached["final_prices"]
 
-    final_prices = []
+    rng = np.random.default_rng(seed)
+    final_prices = simulate_final_prices(returns_array, n_simulations, horizon, initial_price, rng, model)
+    if key is not None:
+        cache.set(key, {"final_prices": final_prices})
+    return final_prices
+
+def run_monte_carlo_streaming(returns_array, n_simulations=1000, horizon=252, initial_price=100,
+                              chunk_size=DEFAULT_CHUNK_SIZE, bins=50, seed=None, n_workers=1,
+                              model="normal", variance_reduction=(), fan_chart=False, thresholds=(),
+                              progress=None, cancel=None, cache=None):
+    """
+    Memory-bounded version of run_monte_carlo for very large path counts.
 
-    # 2) Run multiple simulations
-    for _ in range(n_simulations):
-        # Draw random returns from a normal dist w/ mean=mu and std=sigma
-        random_returns = np.random.normal(mu, sigma, horizon)
+    Paths are simulated in chunks of at most chunk_size and each chunk is folded
+    into a MonteCarloStats accumulator before the next one is drawn, so peak
+    memory depends on chunk_size and horizon only, never on n_simulations.
 
-        # Start at initial_price
-        price_path = initial_price
-        for r in random_returns:
-            price_path *= (1 + r)  # simple step
-        final_prices.append(price_path)
+    Every chunk gets its own Generator spawned from np.random.SeedSequence(seed)
+    and the chunk statistics are merged in chunk order, so for a given seed the
+    result is bit-identical whatever n_workers is. Runs are split into at least
+    MIN_BATCHES chunks, and the spread of the per-chunk estimates gives the
+    standard errors reported by MonteCarloStats.standard_errors().
 
-    return final_prices
+    Parameters:
+    - returns_array, n_simulations, horizon, initial_price: As for run_monte_carlo.
+    - chunk_size: Maximum number of paths simulated per chunk.
+    - bins: Number of fixed histogram bins.
+    - seed: Optional seed (int or np.random.SeedSequence) for reproducible results.
+    - n_workers: Number of worker processes; None or -1 uses every available core.
+    - model: Return model name (see RETURN_MODELS) or model object.
+    - variance_reduction: Any of the VARIANCE_REDUCTION keys (normal model only).
+    - fan_chart: Also track per-day price quantiles for MonteCarloStats.fan_chart().
+    - thresholds: Prices whose exceedance probabilities are counted exactly
+      (see MonteCarloStats.probability_below / probability_above).
+    - progress: Optional callable(stats_by_horizon, paths_done), called after each chunk is merged.
+    - cancel: Optional threading.Event; once set, no further chunk is merged and the
+      partial result comes back with stop_reason 'cancelled'.
+    - cache: Optional NpzCache or DiskCache (e.g. default_result_cache()). Runs with an int seed and a
+      named model are stored there in their compact MonteCarloStats form (no paths) and
+      served from it afterwards; cancelled runs are never stored.
+
+    Returns:
+    - stats: A MonteCarloStats with mean/std/min/max, quantiles, standard errors and the histogram.
+    """
+    return run_monte_carlo_multi_horizon(returns_array, n_simulations, [horizon], initial_price, chunk_size,
+                                         bins, seed, n_workers, model, variance_reduction, fan_chart,
+                                         thresholds, progress, cancel, cache)[horizon]
+
+def run_monte_carlo_multi_horizon(returns_array, n_simulations=1000, checkpoints=(21, 63, 126, 252),
+                                  initial_price=100, chunk_size=DEFAULT_CHUNK_SIZE, bins=50, seed=None,
+                                  n_workers=1, model="normal", variance_reduction=(), fan_chart=False,
+                                  thresholds=(), progress=None, cancel=None, cache=None):
+    """
+    Streaming Monte Carlo that records the price distribution at several horizons in one pass.
+
+    Paths are simulated once up to the longest checkpoint; the running product of
+    growth factors along each path gives the price at every checkpoint day, so
+    shorter horizons (and a fan chart of quantiles over time) cost no extra paths.
+
+    Parameters:
+    - returns_array, n_simulations, initial_price: As for run_monte_carlo.
+    - checkpoints: Horizons (in days) at which to record the price distribution.
+    - chunk_size, bins, seed, n_workers, model, variance_reduction, thresholds, progress, cancel, cache:
+      As for run_monte_carlo_streaming.
+    - fan_chart: Track per-day price quantiles up to the longest checkpoint. Each chunk of
+      paths is folded into one QuantileSketch per day, so memory grows with the horizon
+      only; the sketch is attached to the longest checkpoint's MonteCarloStats.
+
+    Returns:
+    - dict mapping each checkpoint horizon to its MonteCarloStats.
+    """
+    checkpoints = sorted(set(int(h) for h in checkpoints))
+    thresholds = tuple(float(t) for t in thresholds)
+    # n_workers is left out: results are bit-identical whatever the worker count
+    key = _result_key(cache, "multi_horizon", returns_array, n_simulations, checkpoints, initial_price, model, seed,
+                      chunk_size, bins, sorted(variance_reduction), fan_chart, thresholds)
+    if key is not None:
+        stats = _stats_from_cache(cache.get(key), checkpoints)
+        if stats is not None:
+            if progress is not None:
+                progress(stats, n_simulations)
+            return stats
+
+    return_model, use_control = _build_streaming_model(returns_array, model, variance_reduction)
+    stats = {h: MonteCarloStats(histogram_edges(return_model.mu, return_model.sigma, h, initial_price, bins),
+                                thresholds=thresholds)
+             for h in checkpoints}
+
+    chunk_size = _batch_chunk_size(n_simulations, chunk_size, variance_reduction)
+    if _simulate_into(stats, return_model, _chunk_sizes(n_simulations, chunk_size), _as_seed_sequence(seed),
+                      initial_price, use_control, n_workers, fan_chart, progress, cancel):
+        for checkpoint_stats in stats.values():
+            checkpoint_stats.stop_reason = "cancelled"
+    elif key is not None:
+        cache.set(key, {name: value for h, checkpoint_stats in stats.items()
+                        for name, value in _prefixed(f"h{h}_", checkpoint_stats.to_arrays()).items()})
+    return stats
+
+def run_monte_carlo_adaptive(returns_array, horizon=252, initial_price=100, target_mean_error=None,
+                             target_percentile_error=None, percentile=5, confidence=0.95, time_budget=5.0,
+                             max_simulations=10_000_000, initial_simulations=1_000, chunk_size=DEFAULT_CHUNK_SIZE,
+                             bins=50, seed=None, n_workers=1, model="normal", variance_reduction=(),
+                             fan_chart=False, thresholds=(), progress=None, cancel=None):
+    """
+    Streaming Monte Carlo that keeps adding paths until a target precision is reached.
+
+    After each round the confidence-interval half-widths are compared with the
+    targets; the next round is sized from how far off they are (paths needed grow
+    with the square of the precision ratio), capped at doubling the run and at what
+    the remaining time budget allows.
+
+    Parameters:
+    - returns_array, horizon, initial_price: As for run_monte_carlo.
+    - target_mean_error: Wanted CI half-width on the mean final price, in price units (e.g. 0.005 for 0.5p).
+    - target_percentile_error: Wanted CI half-width on the given percentile, relative to it (e.g. 0.01 for 1%).
+    - percentile: Percentile the relative target applies to; must be in TRACKED_PERCENTILES.
+    - confidence: Confidence level of the intervals.
+    - time_budget: Seconds after which no further round is started.
+    - max_simulations: Hard cap on the number of paths.
+    - initial_simulations: Size of the first round.
+    - chunk_size, bins, seed, n_workers, model, variance_reduction, fan_chart, thresholds, progress, cancel:
+      As for run_monte_carlo_streaming.
+
+    Returns:
+    - stats: A MonteCarloStats; stats.count is the number of paths actually used and
+      stats.stop_reason is 'target', 'time_budget', 'max_simulations' or 'cancelled'.
+    """
+    if target_mean_error is None and target_percentile_error is None:
+        raise ValueError("Give target_mean_error and/or target_percentile_error")
+    if target_percentile_error is not None and percentile not in TRACKED_PERCENTILES:
+        raise ValueError(f"percentile must be one of {TRACKED_PERCENTILES}")
+    z_score = NormalDist().inv_cdf(0.5 + confidence / 2)
+
+    return_model, use_control = _build_streaming_model(returns_array, model, variance_reduction)
+    seed_sequence = _as_seed_sequence(seed)
+
+    stats = MonteCarloStats(histogram_edges(return_model.mu, return_model.sigma, horizon, initial_price, bins),
+                            thresholds=thresholds)
+    started = time.perf_counter()
+    round_paths = min(initial_simulations, max_simulations)
+    while True:
+        round_chunk_size = _batch_chunk_size(round_paths, chunk_size, variance_reduction)
+        if _simulate_into({horizon: stats}, return_model, _chunk_sizes(round_paths, round_chunk_size),
+                          seed_sequence, initial_price, use_control, n_workers, fan_chart, progress, cancel):
+            stats.stop_reason = "cancelled"
+            break
+
+        errors = stats.standard_errors()
+        ratios = []
+        if target_mean_error is not None:
+            ratios.append(z_score * errors["mean"] / target_mean_error)
+        if target_percentile_error is not None:
+            ratios.append(z_score * errors[f"p{percentile}"] / (target_percentile_error * abs(stats.percentile(percentile))))
+        ratio = max(ratios)
+
+        elapsed = time.perf_counter() - started
+        if ratio <= 1.0:
+            stats.stop_reason = "target"
+            break
+        if elapsed >= time_budget:
+            stats.stop_reason = "time_budget"
+            break
+        if stats.count >= max_simulations:
+            stats.stop_reason = "max_simulations"
+            break
+
+        needed = math.ceil(stats.count * (ratio ** 2 - 1.0) * 1.1) if np.isfinite(ratio) else stats.count
+        affordable = int(stats.count / max(elapsed, 1e-9) * (time_budget - elapsed))
+        round_paths = max(1, min(needed, stats.count, affordable, max_simulations - stats.count))
+    return stats
+
+class MonteCarloJob:
+    """
+    Runs a streaming simulation (run_monte_carlo_multi_horizon, run_monte_carlo_adaptive, ...)
+    on a background thread.
+
+    The function is called with progress= and cancel= hooked to the job: after every
+    merged chunk a copy of the partial stats is published for snapshot(), and
+    cancel() stops the run before the next chunk, leaving the partial result with
+    stop_reason 'cancelled'.
+    """
+
+    def __init__(self, func, *args, total_paths=None, **kwargs):
+        self.total_paths = total_paths
+        self.paths_done = 0
+        self.result = None
+        self.error = None
+        self._partial = None
+        self._lock = threading.Lock()
+        self._cancel = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(func, args, kwargs), name="monte-carlo-job",
+                                        daemon=True)
+        self._thread.start()
+
+    def _run(self, func, args, kwargs):
+        try:
+            self.result = func(*args, progress=self._publish, cancel=self._cancel, **kwargs)
+        except Exception as e:
+            self.error = e
+
+    def _publish(self, stats, paths_done):
+        partial = copy.deepcopy(stats)
+        with self._lock:
+            self._partial = partial
+            self.paths_done = paths_done
+
+    @property
+    def done(self):
+        return not self._thread.is_alive()
+
+    @property
+    def fraction_done(self):
+        """Share of total_paths merged so far (None when the total isn't known up front)"""
+        if not self.total_paths:
+            return None
+        return min(self.paths_done / self.total_paths, 1.0)
+
+    def snapshot(self):
+        """The latest partial stats published by the run, or None before the first chunk"""
+        with self._lock:
+            return self._partial
+
+    def cancel(self):
+        self._cancel.set()
+
+def default_result_cache():
+    """The shared on-disk cache of simulation results (RESULT_CACHE_DIR, LRU-bounded in size)"""
+    return NpzCache(RESULT_CACHE_DIR)
+
+def _stats_from_cache(arrays, checkpoints):
+    """Per-checkpoint MonteCarloStats of a cached multi-horizon run, or None if it isn't usable"""
+    if arrays is None:
+        return None
+    try:
+        return {h: MonteCarloStats.from_arrays(_unprefixed(f"h{h}_", arrays)) for h in checkpoints}
+    except (KeyError, ValueError, TypeError, IndexError):
+        return None
+
+def _result_key(cache, kind, returns_array, n_simulations, horizon, initial_price, model, seed, *options):
+    """
+    Cache key of a run, or None when it can't be cached: no cache, a model object
+    instead of a model name, or a seed that doesn't reproduce the run (None or a
+    SeedSequence that may already have spawned children).
+    """
+    if cache is None or not isinstance(model, str) or not isinstance(seed, (int, np.integer)):
+        return None
+    returns_array = np.asarray(returns_array, dtype=float)
+    return content_key(RESULT_CACHE_VERSION, kind, returns_array, int(n_simulations), horizon, float(initial_price),
+                       model, int(seed), *options)
+
+def _build_streaming_model(returns_array, model, variance_reduction):
+    unknown = set(variance_reduction) - set(VARIANCE_REDUCTION)
+    if unknown:
+        raise ValueError(f"Unknown variance reduction: {sorted(unknown)}. Expected any of {list(VARIANCE_REDUCTION)}")
+    return_model = build_return_model(returns_array, model,
+                                      antithetic="antithetic" in variance_reduction,
+                                      qmc="sobol" in variance_reduction)
+    use_control = "control_variate" in variance_reduction
+    if use_control and not hasattr(return_model, "control_variate"):
+        raise ValueError(f"The {return_model.name!r} model has no analytic control variate")
+    return return_model, use_control
+
+def _batch_chunk_size(n_simulations, chunk_size, variance_reduction=()):
+    chunk_size = min(chunk_size, max(1, math.ceil(n_simulations / MIN_BATCHES)))
+    if "sobol" in variance_reduction:
+        # Sobol points are best balanced in power-of-two blocks
+        chunk_size = 1 << (chunk_size.bit_length() - 1)
+    return chunk_size
+
+def _simulate_into(stats, return_model, chunk_sizes, seed_sequence, initial_price, use_control, n_workers,
+                   fan_chart=False, progress=None, cancel=None):
+    """
+    Simulate the given chunks, each with a freshly spawned seed, and merge them in order.
+
+    stats maps checkpoint horizons to the MonteCarloStats they are merged into.
+    Returns True if the run was cancelled before every chunk was merged.
+    """
+    checkpoints = list(stats)
+    edges = [(stats[h].edges, stats[h].thresholds) for h in checkpoints]
+    chunk_seeds = seed_sequence.spawn(len(chunk_sizes))
+    tasks = [(return_model, n_paths, checkpoints, initial_price, edges, use_control, fan_chart, chunk_seed)
+             for n_paths, chunk_seed in zip(chunk_sizes, chunk_seeds)]
+    for chunk_stats in _map_chunks(_simulate_chunk_stats, tasks, n_workers):
+        if cancel is not None and cancel.is_set():
+            return True
+        for h, checkpoint_stats in zip(checkpoints, chunk_stats):
+            stats[h].merge(checkpoint_stats)
+        if progress is not None:
+            progress(stats, stats[checkpoints[0]].count)
+    return False
+
+def _simulate_chunk_stats(task):
+    return_model, n_paths, checkpoints, initial_price, edges, use_control, fan_chart, chunk_seed = task
+    rng = np.random.default_rng(chunk_seed)
+    columns = np.asarray(checkpoints) - 1
+
+    returns = return_model.sample(rng, n_paths, checkpoints[-1])
+    if use_control:
+        returns_sums = np.cumsum(returns, axis=1)[:, columns]
+    returns += 1.0
+    # Running product along each path: column h - 1 is the growth factor after h days
+    growth = np.cumprod(returns, axis=1, out=returns)[:, columns]
+
+    chunk_stats = []
+    for i, (horizon, (checkpoint_edges, thresholds)) in enumerate(zip(checkpoints, edges)):
+        control = return_model.control_variate(returns_sums[:, i], horizon, initial_price) if use_control else None
+        chunk_stats.append(MonteCarloStats.from_values(initial_price * growth[:, i], checkpoint_edges,
+                                                       control=control, thresholds=thresholds))
+
+    if fan_chart:
+        returns *= initial_price
+        chunk_stats[-1].add_paths(returns)
+    return chunk_stats
+
+def _chunk_sizes(n_simulations, chunk_size):
+    return [min(chunk_size, n_simulations - start) for start in range(0, n_simulations, chunk_size)]
+
+def _as_seed_sequence(seed):
+    if isinstance(seed, np.random.SeedSequence):
+        return seed
+    return np.random.SeedSequence(seed)
+
+def _child_seed(seed_sequence, index):
+    """The index-th child of seed_sequence, derived without changing its spawn counter"""
+    return np.random.SeedSequence(seed_sequence.entropy, spawn_key=seed_sequence.spawn_key + (index,),
+                                  pool_size=seed_sequence.pool_size)
+
+def resolve_workers(n_workers):
+    """Turn an n_workers argument (None/-1 meaning all cores) into a process count"""
+    if n_workers is None or n_workers < 1:
+        return os.cpu_count() or 1
+    return n_workers
+
+def _map_chunks(func, tasks, n_workers=1):
+    """Yield func(task) for every task, in task order, optionally on a process pool"""
+    n_workers = min(resolve_workers(n_workers), len(tasks))
+    if n_workers <= 1:
+        yield from map(func, tasks)
+        return
+    pool = ProcessPoolExecutor(max_workers=n_workers)
+    try:
+        yield from pool.map(func, tasks)
+    finally:
+        # A consumer that stops early (e.g. a cancelled run) drops the chunks not started yet
+        pool.shutdown(cancel_futures=True)
+
+def histogram_edges(mu, sigma, horizon, initial_price, bins=50, n_std=4.0):
+    """
+    Fixed histogram bin edges for the final price, chosen before any path is simulated.
+
+    The range is the lognormal approximation of the final price +/- n_std standard
+    deviations in log space; anything outside it is counted as under/overflow.
+    """
+    log_center = horizon * (mu - 0.5 * sigma ** 2)
+    log_spread = n_std * sigma * np.sqrt(horizon)
+    low = initial_price * np.exp(log_center - log_spread)
+    high = initial_price * np.exp(log_center + log_spread)
+    return np.linspace(low, high, bins + 1)
+
+
+class QuantileSketch:
+    """
+    Mergeable quantile sketch (KLL-style compactor hierarchy).
+
+    Level L holds sorted samples that each stand for 2**L original values. When a
+    level grows past capacity it is sorted and every other item is promoted to the
+    next level, alternating the starting offset so the rounding errors cancel.
+    Memory is O(capacity * log(n / capacity)) and the rank error is roughly
+    log(n / capacity) / capacity.
+
+    With shape=(horizon,) one sketch tracks a separate distribution per day of a
+    path. Every day sees the same number of values, so all of them compact in
+    lockstep and each compaction is a single sort along the sample axis.
+    """
+
+    def __init__(self, capacity=8192, shape=()):
+        self.capacity = capacity
+        self.shape = tuple(shape)
+        self.count = 0
+        self.levels = []
+        self._offsets = []
+
+    def update(self, values):
+        """Add values of shape (n,) + shape, e.g. an (n_paths x horizon) block of prices"""
+        values = np.asarray(values, dtype=float).reshape((-1,) + self.shape)
+        if values.shape[0] == 0:
+            return
+        # Samples are stored along the last axis so sorting them is contiguous
+        self._append(0, np.moveaxis(values, 0, -1))
+        self.count += values.shape[0]
+        self._compact()
+
+    def merge(self, other):
+        for level, items in enumerate(other.levels):
+            self._append(level, items)
+        self.count += other.count
+        self._compact()
+
+    def quantile(self, q):
+        """Approximate quantile(s) for q in [0, 1]; the result has shape np.shape(q) + shape"""
+        q = np.asarray(q, dtype=float)
+        if self.count == 0:
+            return np.full(q.shape + self.shape, np.nan)[()]
+        values, weights = self._weighted_items()
+        cumulative = np.cumsum(weights, axis=-1)
+        results = []
+        for target in q.ravel() * self.count:
+            idx = np.minimum(np.sum(cumulative < target, axis=-1), values.shape[-1] - 1)
+            results.append(np.take_along_axis(values, idx[..., None], axis=-1)[..., 0])
+        return np.stack(results).reshape(q.shape + self.shape)[()]
+
+    def tail_mean(self, q):
+        """Approximate mean of the lowest fraction q of the values (e.g. expected shortfall)"""
+        if self.count == 0 or q <= 0:
+            return np.full(self.shape, np.nan)[()]
+        values, weights = self._weighted_items()
+        target = q * self.count
+        # Weight of each sorted item that falls inside the tail (the boundary item counts partly)
+        before = np.cumsum(weights, axis=-1) - weights
+        inside = np.clip(target - before, 0.0, weights)
+        return (np.sum(values * inside, axis=-1) / target)[()]
+
+    def to_arrays(self):
+        """The sketch as a dict of plain arrays (levels concatenated), e.g. for an NpzCache"""
+        return {
+            "capacity": np.array(self.capacity),
+            "shape": np.array(self.shape, dtype=np.int64),
+            "count": np.array(self.count),
+            "level_sizes": np.array([items.shape[-1] for items in self.levels], dtype=np.int64),
+            "levels": np.concatenate(self.levels, axis=-1) if self.levels else np.empty(self.shape + (0,)),
+            "offsets": np.array(self._offsets, dtype=np.int64),
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        sketch = cls(int(arrays["capacity"]), tuple(arrays["shape"].tolist()))
+        sketch.count = int(arrays["count"])
+        bounds = np.cumsum(arrays["level_sizes"])[:-1]
+        sketch.levels = list(np.split(arrays["levels"], bounds, axis=-1)) if arrays["level_sizes"].size else []
+        sketch._offsets = arrays["offsets"].tolist()
+        return sketch
+
+    def _weighted_items(self):
+        values = np.concatenate(self.levels, axis=-1)
+        weights = np.concatenate([np.full(items.shape[-1], 2.0 ** level) for level, items in enumerate(self.levels)])
+        order = np.argsort(values, axis=-1, kind="stable")
+        return np.take_along_axis(values, order, axis=-1), weights[order]
+
+    def _append(self, level, items):
+        while len(self.levels) <= level:
+            self.levels.append(np.empty(self.shape + (0,)))
+            self._offsets.append(0)
+        self.levels[level] = np.concatenate([self.levels[level], items], axis=-1)
+
+    def _compact(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            size = items.shape[-1]
+            if size > self.capacity:
+                items = np.sort(items, axis=-1)
+                # An odd item out stays at this level so every promoted pair is complete
+                n_keep = size % 2
+                offset = self._offsets[level]
+                self._offsets[level] = 1 - offset
+                self.levels[level] = items[..., size - n_keep:]
+                self._append(level + 1, items[..., offset:size - n_keep:2])
+            level += 1
+
+
+class BatchEstimates:
+    """
+    Weighted sums of independent per-chunk estimates (batch means).
+
+    Each chunk contributes its own estimate of a few statistics, weighted by its
+    path count. The spread between chunks gives a standard error that stays valid
+    for antithetic, control-variate and randomised quasi-Monte Carlo sampling,
+    where the usual std / sqrt(n) formula does not apply.
+    """
+
+    def __init__(self, size):
+        self.n_batches = 0
+        self._w = 0.0
+        self._w2 = 0.0
+        self._we = np.zeros(size)
+        self._w2e = np.zeros(size)
+        self._w2e2 = np.zeros(size)
+
+    def add(self, weight, estimates):
+        estimates = np.asarray(estimates, dtype=float)
+        self.n_batches += 1
+        self._w += weight
+        self._w2 += weight ** 2
+        self._we += weight * estimates
+        self._w2e += weight ** 2 * estimates
+        self._w2e2 += weight ** 2 * estimates ** 2
+
+    def merge(self, other):
+        self.n_batches += other.n_batches
+        self._w += other._w
+        self._w2 += other._w2
+        self._we += other._we
+        self._w2e += other._w2e
+        self._w2e2 += other._w2e2
+
+    def to_arrays(self):
+        return {
+            "sums": np.array([self.n_batches, self._w, self._w2], dtype=float),
+            "weighted": np.stack([self._we, self._w2e, self._w2e2]),
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        batches = cls(arrays["weighted"].shape[1])
+        n_batches, batches._w, batches._w2 = arrays["sums"].tolist()
+        batches.n_batches = int(n_batches)
+        batches._we, batches._w2e, batches._w2e2 = (row.copy() for row in arrays["weighted"])
+        return batches
+
+    @property
+    def estimate(self):
+        return self._we / self._w
+
+    @property
+    def standard_error(self):
+        if self.n_batches < 2:
+            return np.full(self._we.shape, np.nan)
+        est = self.estimate
+        spread = self._w2e2 - 2 * est * self._w2e + est ** 2 * self._w2
+        return np.sqrt(np.maximum(spread, 0.0) * self.n_batches / (self.n_batches - 1)) / self._w
+
+
+class MonteCarloStats:
+    """
+    Running statistics of simulated final prices, updated one chunk at a time.
+
+    Holds Welford/Chan mean and variance, min/max, a QuantileSketch for the median
+    and percentiles, a fixed-bin histogram with under/overflow counts, and the
+    per-chunk BatchEstimates used for standard errors. All parts are mergeable,
+    so partial results from separate runs can be combined.
+    """
+
+    def __init__(self, edges, sketch_capacity=8192, thresholds=()):
+        self.edges = np.asarray(edges, dtype=float)
+        self.thresholds = tuple(float(t) for t in thresholds)
+        self.below_counts = np.zeros(len(self.thresholds), dtype=np.int64)
+        self.counts = np.zeros(self.edges.size - 1, dtype=np.int64)
+        self.underflow = 0
+        self.overflow = 0
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        self.sketch = QuantileSketch(sketch_capacity)
+        self.batches = BatchEstimates(1 + len(TRACKED_PERCENTILES))
+        self.uses_control = False
+        self.stop_reason = None
+        self.path_sketch = None
+
+    @classmethod
+    def from_values(cls, values, edges, sketch_capacity=8192, control=None, thresholds=()):
+        """
+        Statistics of a single chunk of final prices.
+
+        control: Optional (control values, known expectation) pair; the chunk's mean
+        estimate is then the control-variate adjusted mean.
+        thresholds: Prices below which the values are counted exactly.
+        """
+        chunk = cls(edges, sketch_capacity, thresholds)
+        values = np.asarray(values, dtype=float).ravel()
+        if values.size == 0:
+            return chunk
+        chunk.count = values.size
+        chunk.mean = float(values.mean())
+        chunk._m2 = float(np.sum((values - chunk.mean) ** 2))
+        chunk.min = float(values.min())
+        chunk.max = float(values.max())
+        chunk.counts, _ = np.histogram(values, bins=chunk.edges)
+        chunk.underflow = int(np.count_nonzero(values < chunk.edges[0]))
+        chunk.overflow = int(np.count_nonzero(values > chunk.edges[-1]))
+        chunk.below_counts = np.array([np.count_nonzero(values < t) for t in chunk.thresholds], dtype=np.int64)
+        chunk.sketch.update(values)
+
+        mean_estimate = chunk.mean
+        if control is not None:
+            control_values, control_mean = control
+            chunk.uses_control = True
+            control_var = np.var(control_values)
+            if control_var > 0:
+                beta = np.mean((values - chunk.mean) * (control_values - control_values.mean())) / control_var
+                mean_estimate -= beta * (control_values.mean() - control_mean)
+        chunk.batches.add(values.size, [mean_estimate, *np.percentile(values, TRACKED_PERCENTILES)])
+        return chunk
+
+    def add_paths(self, paths):
+        """Fold an (n_paths x horizon) block of price paths into the per-day quantile sketch"""
+        if self.path_sketch is None:
+            self.path_sketch = QuantileSketch(FAN_SKETCH_CAPACITY, shape=(paths.shape[1],))
+        self.path_sketch.update(paths)
+
+    def update(self, values):
+        """Fold a chunk of final prices into the running statistics"""
+        self.merge(MonteCarloStats.from_values(values, self.edges, self.sketch.capacity, thresholds=self.thresholds))
+
+    def merge(self, other):
+        """Combine another MonteCarloStats (with the same bin edges) into this one"""
+        if other.count == 0:
+            return
+        if self.count == 0:
+            # Copy rather than combine so merging into an empty accumulator is exact
+            self.count, self.mean, self._m2 = other.count, other.mean, other._m2
+            self.min, self.max = other.min, other.max
+            self.counts = self.counts + other.counts
+            self.underflow, self.overflow = other.underflow, other.overflow
+            self.below_counts = self.below_counts + other.below_counts
+            self.sketch.merge(other.sketch)
+            self.batches.merge(other.batches)
+            self.uses_control = other.uses_control
+            self._merge_path_sketch(other)
+            return
+        total = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / total
+        self._m2 += other._m2 + delta ** 2 * self.count * other.count / total
+        self.count = total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.counts += other.counts
+        self.underflow += other.underflow
+        self.overflow += other.overflow
+        self.below_counts += other.below_counts
+        self.sketch.merge(other.sketch)
+        self.batches.merge(other.batches)
+        self.uses_control = self.uses_control or other.uses_control
+        self._merge_path_sketch(other)
+
+    def _merge_path_sketch(self, other):
+        if other.path_sketch is None:
+            return
+        if self.path_sketch is None:
+            self.path_sketch = QuantileSketch(other.path_sketch.capacity, other.path_sketch.shape)
+        self.path_sketch.merge(other.path_sketch)
+
+    def to_arrays(self):
+        """
+        The statistics as a dict of plain arrays (no pickled objects), e.g. for an NpzCache;
+        from_arrays rebuilds them.
+        """
+        arrays = {
+            "edges": self.edges,
+            "thresholds": np.array(self.thresholds, dtype=float),
+            "below_counts": self.below_counts,
+            "counts": self.counts,
+            "tallies": np.array([self.underflow, self.overflow, self.count], dtype=np.int64),
+            "moments": np.array([self.mean, self._m2, self.min, self.max], dtype=float),
+            "uses_control": np.array(self.uses_control),
+            "stop_reason": np.array(self.stop_reason or ""),
+        }
+        arrays.update(_prefixed("sketch_", self.sketch.to_arrays()))
+        arrays.update(_prefixed("batches_", self.batches.to_arrays()))
+        if self.path_sketch is not None:
+            arrays.update(_prefixed("path_sketch_", self.path_sketch.to_arrays()))
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        stats = cls(arrays["edges"], thresholds=arrays["thresholds"].tolist())
+        stats.below_counts = arrays["below_counts"].copy()
+        stats.counts = arrays["counts"].copy()
+        stats.underflow, stats.overflow, stats.count = arrays["tallies"].tolist()
+        stats.mean, stats._m2, stats.min, stats.max = arrays["moments"].tolist()
+        stats.uses_control = bool(arrays["uses_control"])
+        stats.stop_reason = str(arrays["stop_reason"]) or None
+        stats.sketch = QuantileSketch.from_arrays(_unprefixed("sketch_", arrays))
+        stats.batches = BatchEstimates.from_arrays(_unprefixed("batches_", arrays))
+        if "path_sketch_count" in arrays:
+            stats.path_sketch = QuantileSketch.from_arrays(_unprefixed("path_sketch_", arrays))
+        return stats
+
+    def probability_below(self, threshold):
+        """Exact fraction of simulated prices below one of the run's thresholds, with its standard error"""
+        if threshold not in self.thresholds:
+            raise ValueError(f"{threshold} was not one of the thresholds {self.thresholds} given to the run")
+        p = self.below_counts[self.thresholds.index(threshold)] / self.count
+        return float(p), float(np.sqrt(p * (1 - p) / self.count))
+
+    def probability_above(self, threshold):
+        """Fraction of simulated prices above one of the run's thresholds (continuous prices, so 1 - below)"""
+        p, se = self.probability_below(threshold)
+        return 1.0 - p, se
+
+    def risk_metrics(self, initial_price, levels=RISK_LEVELS):
+        """
+        Value at risk and expected shortfall of the final price, from the quantile sketch.
+
+        Both are reported as losses in price units relative to initial_price: VaR at
+        level a is initial_price minus the (1 - a) quantile, expected shortfall is
+        initial_price minus the mean price in that lower tail.
+
+        Returns:
+        - DataFrame indexed by confidence level with 'VaR' and 'Expected Shortfall' columns.
+        """
+        rows = {}
+        for level in levels:
+            tail = 1.0 - level
+            rows[f"{level:.1%}"] = {
+                "VaR": initial_price - float(self.sketch.quantile(tail)),
+                "Expected Shortfall": initial_price - float(self.sketch.tail_mean(tail)),
+            }
+        return pd.DataFrame.from_dict(rows, orient="index")
+
+    def fan_chart(self, percentiles=FAN_CHART_PERCENTILES):
+        """
+        Per-day price percentiles (needs a run with fan_chart=True).
+
+        Returns:
+        - DataFrame indexed by day (1..horizon) with one column per percentile.
+        """
+        if self.path_sketch is None:
+            raise ValueError("No path quantiles recorded; run the simulation with fan_chart=True")
+        return _fan_chart_frame(self.path_sketch, percentiles)
+
+    @property
+    def variance(self):
+        return self._m2 / self.count if self.count else np.nan
+
+    @property
+    def std(self):
+        return np.sqrt(self.variance)
+
+    @property
+    def median(self):
+        return self.percentile(50)
+
+    def percentile(self, q):
+        """Approximate percentile(s), q in [0, 100] as for np.percentile"""
+        return self.sketch.quantile(np.asarray(q, dtype=float) / 100.0)
+
+    @property
+    def mean_estimate(self):
+        """Best estimate of the expected final price (control-variate adjusted when used)"""
+        if self.uses_control and self.batches.n_batches:
+            return float(self.batches.estimate[0])
+        return self.mean
+
+    def standard_errors(self):
+        """
+        Standard errors of the mean estimate and the TRACKED_PERCENTILES, from the
+        spread of the per-chunk estimates. Falls back to std / sqrt(n) for the mean
+        when the run had a single chunk.
+        """
+        errors = self.batches.standard_error
+        mean_se = errors[0] if self.batches.n_batches >= 2 else self.std / np.sqrt(max(self.count, 1))
+        result = {"mean": float(mean_se)}
+        for q, se in zip(TRACKED_PERCENTILES, errors[1:]):
+            result[f"p{q}"] = float(se)
+        return result
+
+    def summary(self):
+        return {
+            "n_simulations": self.count,
+            "mean": self.mean_estimate,
+            "mean_se": self.standard_errors()["mean"],
+            "std": float(self.std),
+            "median": float(self.median),
+            "min": self.min,
+            "max": self.max,
+        }
+
+
+def _prefixed(prefix, arrays):
+    return {prefix + name: value for name, value in arrays.items()}
+
+def _unprefixed(prefix, arrays):
+    return {name[len(prefix):]: value for name, value in arrays.items() if name.startswith(prefix)}
+
+
+# ------------------ IMPORTANCE SAMPLING ------------------
+def tail_drift(mu, sigma, horizon, initial_price, threshold):
+    """
+    Daily drift that makes the threshold the typical final price.
+
+    With E[log(1 + r)] ~ mu - sigma^2 / 2, a drift of log(threshold / P0) / h + sigma^2 / 2
+    centres the log final price on log(threshold), so about half of the tilted
+    paths land in the tail instead of almost none.
+    """
+    return math.log(threshold / initial_price) / horizon + 0.5 * sigma ** 2
+
+def run_importance_sampling(returns_array, threshold, n_simulations=10_000, horizon=252, initial_price=100,
+                            direction="below", barrier=False, tilted_drift=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                            seed=None, n_workers=1):
+    """
+    Tail probability of the share price by exponentially tilted importance sampling.
+
+    Daily returns are drawn from the fitted normal model with its drift moved
+    towards the threshold (see tail_drift). Each path is weighted by its
+    likelihood ratio against the untilted model,
+        L = exp(-(m - mu) / sigma^2 * (sum(r) - h (mu + m) / 2)),
+    which only depends on the sum of the path's returns, so the weighted tail
+    indicator is an unbiased estimate of the untilted probability. Chunks are
+    simulated and reduced to running sums exactly as in run_monte_carlo_streaming.
+
+    Parameters:
+    - returns_array, n_simulations, horizon, initial_price: As for run_monte_carlo.
+    - threshold: Price level defining the tail event.
+    - direction: 'below' for P(price < threshold), 'above' for P(price > threshold).
+    - barrier: If True the event is the price crossing the threshold on any day up to
+      the horizon, otherwise only the final price counts.
+    - tilted_drift: Daily drift of the sampling distribution; defaults to tail_drift(...).
+    - chunk_size, seed, n_workers: As for run_monte_carlo_streaming.
+
+    Returns:
+    - dict with 'probability', 'standard_error', 'n_simulations', 'tilted_drift' and
+      'effective_sample_size' (Kish ESS of the likelihood-ratio weights).
+    """
+    if direction not in ("below", "above"):
+        raise ValueError(f"direction must be 'below' or 'above', got {direction!r}")
+    mu, sigma = fit_normal(returns_array)
+    if tilted_drift is None:
+        tilted_drift = tail_drift(mu, sigma, horizon, initial_price, threshold)
+
+    chunk_sizes = _chunk_sizes(n_simulations, _batch_chunk_size(n_simulations, chunk_size))
+    chunk_seeds = _as_seed_sequence(seed).spawn(len(chunk_sizes))
+    tasks = [(mu, sigma, tilted_drift, n_paths, horizon, initial_price, threshold, direction, barrier, chunk_seed)
+             for n_paths, chunk_seed in zip(chunk_sizes, chunk_seeds)]
+
+    # Running sums of the weighted indicator, its square, and the weights (for the ESS)
+    totals = np.zeros(4)
+    for chunk_totals in _map_chunks(_importance_chunk_sums, tasks, n_workers):
+        totals += chunk_totals
+    hit_sum, hit_sq_sum, weight_sum, weight_sq_sum = totals
+
+    probability = hit_sum / n_simulations
+    variance = max(hit_sq_sum / n_simulations - probability ** 2, 0.0)
+    return {
+        "probability": float(probability),
+        "standard_error": float(np.sqrt(variance / max(n_simulations - 1, 1))),
+        "n_simulations": n_simulations,
+        "tilted_drift": float(tilted_drift),
+        "effective_sample_size": float(weight_sum ** 2 / weight_sq_sum) if weight_sq_sum > 0 else 0.0,
+    }
+
+def _importance_chunk_sums(task):
+    mu, sigma, tilted_drift, n_paths, horizon, initial_price, threshold, direction, barrier, chunk_seed = task
+    rng = np.random.default_rng(chunk_seed)
+
+    returns = rng.normal(tilted_drift, sigma, size=(n_paths, horizon))
+    log_weights = -(tilted_drift - mu) / sigma ** 2 * (returns.sum(axis=1) - horizon * (mu + tilted_drift) / 2)
+    weights = np.exp(log_weights)
+
+    returns += 1.0
+    if barrier:
+        prices = np.cumprod(returns, axis=1, out=returns)
+        extreme = prices.min(axis=1) if direction == "below" else prices.max(axis=1)
+    else:
+        extreme = np.prod(returns, axis=1)
+    extreme *= initial_price
+    hits = extreme < threshold if direction == "below" else extreme > threshold
+
+    weighted_hits = np.where(hits, weights, 0.0)
+    return np.array([weighted_hits.sum(), (weighted_hits ** 2).sum(), weights.sum(), (weights ** 2).sum()])
+
+
+# ------------------ PATH STATISTICS ------------------
+PATH_STATISTICS = ("final", "min", "max", "max_drawdown", "barrier_day")
+
+def simulate_path_statistics(returns_array, n_simulations=1000, horizon=252, initial_price=100, barrier=None,
+                             seed=None, model="normal", chunk_size=DEFAULT_CHUNK_SIZE, engine="auto"):
+    """
+    Per-path statistics of simulated price paths, for path-dependent payoffs.
+
+    Chunks are drawn as in run_monte_carlo_streaming and each one is reduced by
+    path_statistics, so only the (chunk_size x horizon) returns block is ever held.
+
+    Parameters:
+    - returns_array, n_simulations, horizon, initial_price: As for run_monte_carlo.
+    - barrier: Optional price; barrier_day is the first day the price is at or below it.
+    - seed, model, chunk_size: As for run_monte_carlo_streaming.
+    - engine: 'numba', 'numpy' or 'auto' (Numba when it is installed).
+
+    Returns:
+    - dict mapping each PATH_STATISTICS name to an array with one value per path.
+    """
+    return_model = build_return_model(returns_array, model)
+    chunk_sizes = _chunk_sizes(n_simulations, chunk_size)
+    chunks = []
+    for n_paths, chunk_seed in zip(chunk_sizes, _as_seed_sequence(seed).spawn(len(chunk_sizes))):
+        returns = return_model.sample(np.random.default_rng(chunk_seed), n_paths, horizon)
+        chunks.append(path_statistics(returns, initial_price, barrier, engine))
+    return {name: np.concatenate([chunk[name] for chunk in chunks]) for name in PATH_STATISTICS}
+
+def path_statistics(returns, initial_price, barrier=None, engine="auto"):
+    """
+    Final price, path minimum / maximum, maximum drawdown and first barrier day of each path.
+
+    The Numba kernel walks every path once in a single fused loop, with paths
+    split across threads and no temporaries beyond the outputs; the NumPy
+    fallback needs a few (n_paths x horizon) temporaries for the same numbers.
+    Drawdowns are measured from the running peak, starting at initial_price.
+
+    Parameters:
+    - returns: (n_paths x horizon) array of simulated simple returns (left unchanged).
+    - initial_price: The starting price of every path.
+    - barrier: Optional price; barrier_day is the first day (1-based) the price is at
+      or below it, -1 if never (and always -1 without a barrier).
+    - engine: 'numba', 'numpy' or 'auto' (Numba when it is installed).
+
+    Returns:
+    - dict mapping each PATH_STATISTICS name to a length-n_paths array.
+    """
+    return _path_statistics(returns, initial_price, barrier, engine, compound=True)
+
+def _path_statistics(block, initial_price, barrier, engine, compound):
+    """path_statistics of a block of returns (compound=True) or of prices (compound=False)"""
+    if engine not in ("auto", "numba", "numpy"):
+        raise ValueError(f"engine must be 'auto', 'numba' or 'numpy', got {engine!r}")
+    if engine == "numba" and numba is None:
+        raise ImportError("The numba engine requires numba (pip install numba)")
+    barrier = -np.inf if barrier is None else float(barrier)
+
+    if engine == "numpy" or numba is None:
+        return _path_statistics_numpy(block, initial_price, barrier, compound)
+
+    n_paths = block.shape[0]
+    stats = {name: np.empty(n_paths) for name in PATH_STATISTICS[:-1]}
+    stats["barrier_day"] = np.empty(n_paths, dtype=np.int64)
+
+    _prefer_threading_layer()
+    _path_statistics_kernel(block, float(initial_price), barrier, compound, *stats.values())
+    return stats
+
+_threading_layer_lock = threading.Lock()
+_threading_layer_set = False
+
+def _prefer_threading_layer():
+    """
+    Prefer OpenMP as Numba's threading layer, once per process, before the first parallel launch.
+
+    Numba picks its threading layer at the first parallel launch in the process. The
+    kernel runs on Streamlit's script threads, and a TBB pool first started off the main
+    thread can hang at interpreter exit, so OpenMP goes first unless the user has chosen
+    a priority through the environment. The setting is global and never restored.
+    """
+    global _threading_layer_set
+    if _threading_layer_set:
+        return
+    with _threading_layer_lock:
+        if not _threading_layer_set and "NUMBA_THREADING_LAYER_PRIORITY" not in os.environ:
+            numba.config.THREADING_LAYER_PRIORITY = ["omp", "tbb", "workqueue"]
+        _threading_layer_set = True
+
+def _path_statistics_numpy(block, initial_price, barrier, compound):
+    if compound:
+        prices = np.cumprod(block + 1.0, axis=1)
+        prices *= initial_price
+    else:
+        prices = block
+    peaks = np.maximum.accumulate(prices, axis=1)
+    np.maximum(peaks, initial_price, out=peaks)
+    hits = prices <= barrier
+    hit_any = hits.any(axis=1)
+    return {
+        "final": prices[:, -1].astype(float),
+        "min": prices.min(axis=1).astype(float),
+        "max": prices.max(axis=1).astype(float),
+        "max_drawdown": (1.0 - prices / peaks).max(axis=1).astype(float),
+        "barrier_day": np.where(hit_any, hits.argmax(axis=1) + 1, -1),
+    }
+
+if numba is not None:
+    @numba.njit(parallel=True, cache=True)
+    def _path_statistics_kernel(block, initial_price, barrier, compound, final, minimum, maximum, max_drawdown,
+                                barrier_day):
+        n_paths, horizon = block.shape
+        for i in numba.prange(n_paths):
+            price = initial_price
+            peak = initial_price
+            low = np.inf
+            high = -np.inf
+            drawdown = 0.0
+            hit_day = -1
+            for t in range(horizon):
+                if compound:
+                    price *= 1.0 + block[i, t]
+                else:
+                    price = block[i, t]
+                low = min(low, price)
+                high = max(high, price)
+                peak = max(peak, price)
+                drawdown = max(drawdown, 1.0 - price / peak)
+                if hit_day < 0 and price <= barrier:
+                    hit_day = t + 1
+            final[i] = price
+            minimum[i] = low
+            maximum[i] = high
+            max_drawdown[i] = drawdown
+            barrier_day[i] = hit_day
+
+def warm_up_kernels(background=False):
+    """
+    Compile the Numba path kernel (float64 / float32, C / Fortran order) before it is needed.
+
+    Compiled code is also cached on disk, so later processes only load it. With
+    background=True the compilation runs on a separate thread, which is returned (not a
+    daemon: interrupting LLVM at interpreter exit can hang the process);
+    without Numba this does nothing and returns None.
+    """
+    if numba is None:
+        return None
+
+    def compile_kernels():
+        _prefer_threading_layer()
+        # GarchReturns hands out day-major blocks transposed, i.e. Fortran-ordered
+        for dtype in (np.float64, np.float32):
+            for order in ("C", "F"):
+                _path_statistics(np.zeros((2, 2), dtype=dtype, order=order), 1.0, 0.5, "numba", compound=True)
+
+    if not background:
+        compile_kernels()
+        return None
+    thread = threading.Thread(target=compile_kernels, name="monte-carlo-warm-up")
+    thread.start()
+    return thread
+
+
+# ------------------ PATH STORE ------------------
+# Bytes reserved at the start of a path store for its JSON metadata header
+PATH_STORE_HEADER_BYTES = 4096
+PATH_STORE_MAGIC = b"EZJPATHS"
+
+class PathStore:
+    """
+    Simulated price paths in a float32 file, read through np.memmap.
+
+    The file starts with PATH_STORE_HEADER_BYTES of metadata (magic bytes, then a
+    JSON object with n_paths, horizon, initial_price, model, seed, ...) followed by
+    the (n_paths x horizon) price matrix in C order, so a block of paths is one
+    contiguous read. Analyses walk the paths in row slices of the memmap, which
+    are views of the file pages rather than copies, so memory use depends on
+    chunk_size and not on the number of paths.
+    """
+
+    def __init__(self, path, metadata, paths):
+        self.path = path
+        self.metadata = metadata
+        self.paths = paths
+
+    @classmethod
+    def create(cls, path, n_paths, horizon, **metadata):
+        """New writable store; its header is marked complete only by finish()"""
+        metadata = dict(metadata, n_paths=int(n_paths), horizon=int(horizon), dtype="float32", complete=False)
+        _write_path_store_header(path, metadata, truncate=True)
+        paths = np.memmap(path, dtype=np.float32, mode="r+", offset=PATH_STORE_HEADER_BYTES,
+                          shape=(n_paths, horizon))
+        return cls(path, metadata, paths)
+
+    @classmethod
+    def open(cls, path, mode="r"):
+        """Open an existing, complete store (read-only by default)"""
+        with open(path, "rb") as f:
+            header = f.read(PATH_STORE_HEADER_BYTES)
+        if not header.startswith(PATH_STORE_MAGIC):
+            raise ValueError(f"{path} is not a path store")
+        metadata = json.loads(header[len(PATH_STORE_MAGIC):].rstrip(b"\0"))
+        if not metadata.get("complete"):
+            raise ValueError(f"{path} was not completely written")
+        paths = np.memmap(path, dtype=np.float32, mode=mode, offset=PATH_STORE_HEADER_BYTES,
+                          shape=(metadata["n_paths"], metadata["horizon"]))
+        return cls(path, metadata, paths)
+
+    def finish(self):
+        self.paths.flush()
+        self.metadata["complete"] = True
+        _write_path_store_header(self.path, self.metadata)
+
+    @property
+    def n_paths(self):
+        return self.metadata["n_paths"]
+
+    @property
+    def horizon(self):
+        return self.metadata["horizon"]
+
+    @property
+    def initial_price(self):
+        return self.metadata["initial_price"]
+
+    def iter_chunks(self, chunk_size=DEFAULT_CHUNK_SIZE, days=None):
+        """Yield (n x days) row slices of the paths as zero-copy ndarray views of the file"""
+        days = self.horizon if days is None else days
+        for start in range(0, self.n_paths, chunk_size):
+            yield np.asarray(self.paths[start:start + chunk_size, :days])
+
+    def path_statistics(self, barrier=None, days=None, chunk_size=DEFAULT_CHUNK_SIZE, engine="auto"):
+        """path_statistics (final/min/max/max_drawdown/barrier_day) of every stored path over the first days"""
+        chunks = [_path_statistics(block, self.initial_price, barrier, engine, compound=False)
+                  for block in self.iter_chunks(chunk_size, days)]
+        return {name: np.concatenate([chunk[name] for chunk in chunks]) for name in PATH_STATISTICS}
+
+    def barrier_probability(self, barrier, days=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Fraction of paths at or below barrier on some day up to days (default: the whole horizon)"""
+        hit_days = self.path_statistics(barrier, days, chunk_size)["barrier_day"]
+        return float(np.mean(hit_days > 0))
+
+    def fan_chart(self, percentiles=FAN_CHART_PERCENTILES, days=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Per-day price percentiles over the first days, built with the same streaming sketch as a run"""
+        days = self.horizon if days is None else days
+        sketch = QuantileSketch(FAN_SKETCH_CAPACITY, shape=(days,))
+        for block in self.iter_chunks(chunk_size, days):
+            sketch.update(block)
+        return _fan_chart_frame(sketch, percentiles)
+
+def _write_path_store_header(path, metadata, truncate=False):
+    header = PATH_STORE_MAGIC + json.dumps(metadata).encode()
+    if len(header) > PATH_STORE_HEADER_BYTES:
+        raise ValueError("Path store metadata is too large for the header")
+    with open(path, "wb" if truncate else "r+b") as f:
+        f.write(header.ljust(PATH_STORE_HEADER_BYTES, b"\0"))
+
+def simulate_to_path_store(path, returns_array, n_simulations=1000, horizon=252, initial_price=100, seed=None,
+                           model="normal", chunk_size=DEFAULT_CHUNK_SIZE, n_workers=1):
+    """
+    Simulate price paths straight into a float32 PathStore on disk, chunk by chunk.
+
+    Each chunk gets its own spawned seed as in run_monte_carlo_streaming, and each
+    worker process writes its rows into the memmap itself, so no paths are ever
+    sent between processes or held in memory beyond one chunk. 1M x 252 paths
+    take about 1 GB on disk.
+
+    Parameters:
+    - path: File to create (overwritten if it exists).
+    - returns_array, n_simulations, horizon, initial_price: As for run_monte_carlo.
+    - seed, model, chunk_size, n_workers: As for run_monte_carlo_streaming.
+
+    Returns:
+    - The completed PathStore, opened read-only.
+    """
+    return_model = build_return_model(returns_array, model)
+    store = PathStore.create(path, n_simulations, horizon, initial_price=float(initial_price),
+                             model=return_model.name, seed=seed if isinstance(seed, (int, type(None))) else None)
+
+    chunk_sizes = _chunk_sizes(n_simulations, chunk_size)
+    chunk_seeds = _as_seed_sequence(seed).spawn(len(chunk_sizes))
+    starts = np.cumsum([0] + chunk_sizes[:-1])
+    tasks = [(path, int(start), n_paths, n_simulations, horizon, initial_price, return_model, chunk_seed)
+             for start, n_paths, chunk_seed in zip(starts, chunk_sizes, chunk_seeds)]
+    # Workers map the same file and write their own rows; the mapping is shared, so no copy comes back
+    for _ in _map_chunks(_path_store_chunk, tasks, n_workers):
+        pass
+    store.finish()
+    return PathStore.open(path)
+
+def _path_store_chunk(task):
+    path, start, n_paths, n_simulations, horizon, initial_price, return_model, chunk_seed = task
+    rng = np.random.default_rng(chunk_seed)
+    prices = return_model.sample(rng, n_paths, horizon)
+    prices += 1.0
+    np.cumprod(prices, axis=1, out=prices)
+    prices *= initial_price
+
+    paths = np.memmap(path, dtype=np.float32, mode="r+", offset=PATH_STORE_HEADER_BYTES,
+                      shape=(n_simulations, horizon))
+    paths[start:start + n_paths] = prices
+    paths.flush()
+    del paths
+
+
+# ------------------ LIKELIHOOD-RATIO SENSITIVITY ------------------
+# Re-weighted runs whose effective sample size falls below this fraction of the paths are re-simulated
+MIN_ESS_FRACTION = 0.1
+
+class ReweightableSimulation:
+    """
+    Normal-model paths kept with the sufficient statistics of their returns.
+
+    Under i.i.d. N(mu, sigma^2) returns a path's likelihood depends only on the sum
+    and the sum of squares of its returns, so the same paths can be re-weighted to
+    any other (mu, sigma) by
+        log L = -h log(sigma' / sigma) - (S2 - 2 mu' S1 + h mu'^2) / (2 sigma'^2)
+                                       + (S2 - 2 mu S1 + h mu^2) / (2 sigma^2),
+    which is O(n_paths) instead of a new (n_paths x horizon) simulation.
+    Final prices are stored sorted so weighted percentiles are a cumulative sum.
+    """
+
+    def __init__(self, final_prices, return_sums, return_sq_sums, mu, sigma, horizon, initial_price,
+                 seed_sequence):
+        order = np.argsort(final_prices)
+        self.final_prices = final_prices[order]
+        self.return_sums = return_sums[order]
+        self.return_sq_sums = return_sq_sums[order]
+        self.mu, self.sigma = mu, sigma
+        self.horizon = horizon
+        self.initial_price = initial_price
+        self.seed_sequence = seed_sequence
+
+    @property
+    def count(self):
+        return self.final_prices.size
+
+    def rescaled(self, initial_price):
+        """The same paths started from initial_price: prices scale with it, returns don't"""
+        simulation = copy.copy(self)
+        simulation.final_prices = self.final_prices * (initial_price / self.initial_price)
+        simulation.initial_price = initial_price
+        return simulation
+
+    def weights(self, mu, sigma):
+        """Likelihood-ratio weights of the paths under (mu, sigma), normalised to sum to 1"""
+        h = self.horizon
+        log_weights = (-h * math.log(sigma / self.sigma)
+                       - (self.return_sq_sums - 2 * mu * self.return_sums + h * mu ** 2) / (2 * sigma ** 2)
+                       + (self.return_sq_sums - 2 * self.mu * self.return_sums + h * self.mu ** 2) / (2 * self.sigma ** 2))
+        log_weights -= log_weights.max()
+        weights = np.exp(log_weights)
+        return weights / weights.sum()
+
+    def at(self, mu, sigma, min_ess_fraction=MIN_ESS_FRACTION, n_workers=1):
+        """
+        Weights for (mu, sigma), re-simulating when re-weighting would be too noisy.
+
+        Returns:
+        - (simulation, weights, resimulated): the simulation the weights apply to (self, or
+          a fresh run at (mu, sigma) with the same path count when the effective sample size
+          drops below min_ess_fraction of the paths) and its normalised weights.
+        """
+        weights = self.weights(mu, sigma)
+        if effective_sample_size(weights) >= min_ess_fraction * self.count:
+            return self, weights, False
+        # A fixed child of this run's seed rather than spawn(), which would advance a seed
+        # sequence shared by every caller of a cached base
+        simulation = _simulate_reweightable(mu, sigma, self.count, (self.horizon,), self.initial_price,
+                                            _child_seed(self.seed_sequence, 0), n_workers=n_workers)[self.horizon]
+        return simulation, np.full(simulation.count, 1.0 / simulation.count), True
+
+    def summary(self, weights, percentiles=TRACKED_PERCENTILES):
+        """Weighted mean, standard deviation, percentiles and effective sample size of the final price"""
+        mean = float(weights @ self.final_prices)
+        result = {
+            "mean": mean,
+            "std": float(np.sqrt(weights @ (self.final_prices - mean) ** 2)),
+            "effective_sample_size": effective_sample_size(weights),
+        }
+        cumulative = np.cumsum(weights)
+        for q in percentiles:
+            idx = min(np.searchsorted(cumulative, q / 100), self.count - 1)
+            result[f"p{q}"] = float(self.final_prices[idx])
+        return result
+
+    def histogram(self, weights, edges):
+        """Weighted histogram of the final price, scaled to path counts"""
+        counts, _ = np.histogram(self.final_prices, bins=edges, weights=weights)
+        return counts * self.count
+
+def effective_sample_size(weights):
+    """Kish effective sample size of a set of (not necessarily normalised) weights"""
+    return float(weights.sum() ** 2 / (weights @ weights))
+
+def run_reweightable_monte_carlo(returns_array, n_simulations=100_000, horizon=252, initial_price=100, seed=None,
+                                 chunk_size=DEFAULT_CHUNK_SIZE, n_workers=1):
+    """
+    Base simulation for drift / volatility sensitivity by likelihood-ratio re-weighting.
+
+    Simulates the fitted normal model in chunks (as run_monte_carlo_streaming) but
+    keeps, for every path, its final price and the sum and sum of squares of its
+    returns: 3 floats per path instead of the whole path.
+
+    Parameters:
+    - returns_array, n_simulations, horizon, initial_price: As for run_monte_carlo.
+    - seed, chunk_size, n_workers: As for run_monte_carlo_streaming.
+
+    Returns:
+    - A ReweightableSimulation; use .at(mu, sigma) to move the knobs.
+    """
+    return run_reweightable_monte_carlo_multi_horizon(returns_array, n_simulations, (horizon,), initial_price, seed,
+                                                      chunk_size, n_workers)[horizon]
+
+def run_reweightable_monte_carlo_multi_horizon(returns_array, n_simulations=100_000, checkpoints=(21, 63, 126, 252),
+                                               initial_price=100, seed=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                                               n_workers=1):
+    """
+    run_reweightable_monte_carlo at several horizons from one set of paths.
+
+    Paths are simulated once up to the longest checkpoint, and the price and return
+    sums of every path are kept at each checkpoint day (3 floats per path and
+    checkpoint), so switching horizon costs no new simulation.
+
+    Parameters:
+    - returns_array, n_simulations, initial_price, seed, chunk_size, n_workers: As for
+      run_reweightable_monte_carlo.
+    - checkpoints: Horizons (in days) to keep the paths' statistics at.
+
+    Returns:
+    - dict mapping each checkpoint horizon to its ReweightableSimulation.
+    """
+    mu, sigma = fit_normal(returns_array)
+    return _simulate_reweightable(mu, sigma, n_simulations, checkpoints, initial_price, _as_seed_sequence(seed),
+                                  chunk_size, n_workers)
+
+def _simulate_reweightable(mu, sigma, n_simulations, checkpoints, initial_price, seed_sequence,
+                           chunk_size=DEFAULT_CHUNK_SIZE, n_workers=1):
+    checkpoints = sorted(set(int(h) for h in checkpoints))
+    chunk_sizes = _chunk_sizes(n_simulations, chunk_size)
+    # Child 0 is kept for ReweightableSimulation.at's re-simulations
+    chunk_seeds = [_child_seed(seed_sequence, i + 1) for i in range(len(chunk_sizes))]
+    tasks = [(mu, sigma, n_paths, checkpoints, chunk_seed) for n_paths, chunk_seed in zip(chunk_sizes, chunk_seeds)]
+    growth, sums, sq_sums = (np.concatenate(parts)
+                             for parts in zip(*_map_chunks(_reweightable_chunk, tasks, n_workers)))
+    return {horizon: ReweightableSimulation(initial_price * growth[:, i], sums[:, i], sq_sums[:, i], mu, sigma,
+                                            horizon, initial_price, seed_sequence)
+            for i, horizon in enumerate(checkpoints)}
+
+def _reweightable_chunk(task):
+    mu, sigma, n_paths, checkpoints, chunk_seed = task
+    rng = np.random.default_rng(chunk_seed)
+    returns = rng.normal(mu, sigma, size=(n_paths, checkpoints[-1]))
+    columns = np.asarray(checkpoints) - 1
+    sums = np.cumsum(returns, axis=1)[:, columns]
+    sq_sums = np.cumsum(returns * returns, axis=1)[:, columns]
+    returns += 1.0
+    return np.cumprod(returns, axis=1)[:, columns], sums, sq_sums
+
+
+def _fan_chart_frame(path_sketch, percentiles):
+    bands = path_sketch.quantile(np.asarray(percentiles, dtype=float) / 100.0)
+    days = pd.RangeIndex(1, path_sketch.shape[0] + 1, name="Day")
+    return pd.DataFrame(bands.T, index=days, columns=list(percentiles))
+
+
+# ------------------ VALUATION INPUTS ------------------
+# Marginal distributions for the DCF inputs, given as (name, *parameters)
+VALUATION_DISTRIBUTIONS = {
+    "normal": "Normal (mean, std)",
+    "lognormal": "Lognormal (median, log std)",
+    "uniform": "Uniform (low, high)",
+    "triangular": "Triangular (low, mode, high)",
+}
+VALUATION_INPUTS = ("wacc", "terminal_growth", "fcf_scale")
+
+def default_valuation_distributions(cash_flow_inputs):
+    """Distributions centred on the workbook's inputs: +/-1pt WACC, +/-0.5pt growth, +/-10% FCF"""
+    return {
+        "wacc": ("normal", cash_flow_inputs["wacc"], 0.01),
+        "terminal_growth": ("normal", cash_flow_inputs["terminal_growth"], 0.005),
+        "fcf_scale": ("lognormal", 1.0, 0.10),
+    }
+
+def run_valuation_monte_carlo(cash_flow_inputs, distributions=None, correlation=None, n_scenarios=1_000_000,
+                              seed=None):
+    """
+    Monte Carlo of the DCF share price (perpetuity growth method) over uncertain inputs.
+
+    WACC, terminal growth and a multiplier on every forecast free cash flow are
+    drawn jointly: correlated standard normals (Cholesky factor of `correlation`)
+    are mapped onto each input's marginal distribution (a Gaussian copula). The
+    DCF is then evaluated for all scenarios at once,
+        EV = s * sum_t UFCF_t (1 + w)^-p_t + s * UFCF_T (1 + g) / (w - g) * (1 + w)^-p_T,
+    discounting the terminal value with the final year's factor as the workbook
+    does. Scenarios with g >= WACC have no finite terminal value and are masked out.
+
+    Parameters:
+    - cash_flow_inputs: dict from DCFAnalyzer.extract_cash_flow_inputs().
+    - distributions: dict mapping each of VALUATION_INPUTS to a (name, *parameters) tuple
+      (see VALUATION_DISTRIBUTIONS); missing inputs use default_valuation_distributions.
+    - correlation: Optional 3x3 correlation matrix in VALUATION_INPUTS order.
+    - n_scenarios: Number of input scenarios.
+    - seed: Optional seed for reproducible results.
+
+    Returns:
+    - dict with 'share_prices' and the sampled 'wacc', 'terminal_growth', 'fcf_scale'
+      (valid scenarios only), and 'valid_fraction' (share of scenarios with g < WACC).
+    """
+    distributions = dict(default_valuation_distributions(cash_flow_inputs), **(distributions or {}))
+    correlation = np.eye(len(VALUATION_INPUTS)) if correlation is None else np.asarray(correlation, dtype=float)
+    rng = np.random.default_rng(seed)
+
+    shocks = rng.standard_normal((n_scenarios, len(VALUATION_INPUTS))) @ np.linalg.cholesky(correlation).T
+    samples = {name: _from_standard_normal(shocks[:, i], distributions[name])
+               for i, name in enumerate(VALUATION_INPUTS)}
+    wacc, growth, scale = samples["wacc"], samples["terminal_growth"], samples["fcf_scale"]
+
+    valid = (growth < wacc) & (wacc > -1.0)
+    wacc, growth, scale = wacc[valid], growth[valid], scale[valid]
+
+    ufcf = np.asarray(cash_flow_inputs["ufcf"], dtype=float)
+    periods = np.asarray(cash_flow_inputs["discount_periods"], dtype=float)
+    # (scenarios x years) discount factors in one broadcast: (1 + w)^-p = exp(-p log(1 + w))
+    factors = np.exp(np.multiply.outer(-np.log1p(wacc), periods))
+    pv_fcf = factors @ ufcf
+    pv_terminal = ufcf[-1] * (1.0 + growth) / (wacc - growth) * factors[:, -1]
+    enterprise_value = scale * (pv_fcf + pv_terminal)
+    share_prices = (enterprise_value + cash_flow_inputs["equity_bridge"]) / cash_flow_inputs["diluted_shares_outstanding"]
+
+    return {
+        "share_prices": share_prices,
+        "wacc": wacc,
+        "terminal_growth": growth,
+        "fcf_scale": scale,
+        "valid_fraction": float(valid.mean()),
+    }
+
+def _from_standard_normal(z, distribution):
+    """Map standard normal draws onto a (name, *parameters) marginal distribution"""
+    name, *params = distribution
+    if name == "normal":
+        mean, std = params
+        return mean + std * z
+    if name == "lognormal":
+        median, log_std = params
+        return median * np.exp(log_std * z)
+    if name == "uniform":
+        low, high = params
+        return low + (high - low) * _normal_cdf(z)
+    if name == "triangular":
+        low, mode, high = params
+        u = _normal_cdf(z)
+        split = (mode - low) / (high - low)
+        return np.where(u < split,
+                        low + np.sqrt(u * (high - low) * (mode - low)),
+                        high - np.sqrt((1.0 - u) * (high - low) * (high - mode)))
+    raise ValueError(f"Unknown distribution: {name!r}. Expected one of {list(VALUATION_DISTRIBUTIONS)}")
+
+def _normal_cdf(z):
+    """Standard normal CDF via the Abramowitz & Stegun 7.1.26 erf approximation (error < 1.5e-7)"""
+    x = np.abs(z) / math.sqrt(2.0)
+    t = 1.0 / (1.0 + 0.3275911 * x)
+    poly = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    erf = 1.0 - poly * np.exp(-x * x)
+    return 0.5 * (1.0 + np.sign(z) * erf)
+
+
+# ------------------ MULTI-ASSET ------------------
+PEER_TICKERS = ["EZJ.L", "RYA.I", "WIZZ.L", "LHAG.DE", "ICAG.L", "AIRF.PA", "JET2.L", "KNIN.S"]
+
+def load_peer_returns(tickers=PEER_TICKERS, directory="attached_assets"):
+    """
+    Load the peer return CSVs and align them on their common trading dates.
+
+    Returns:
+    - DataFrame with one 'Returns' column per ticker, indexed by date, no missing values.
+    """
+    columns = {ticker: load_returns(ticker, directory) for ticker in tickers}
+    return pd.concat(columns, axis=1, join="inner").dropna()
+
+def load_returns(ticker, directory="attached_assets"):
+    """The 'Returns' series of one ticker's return CSV (e.g. EZJ.L -> EZJ_L_returns.csv), indexed by date"""
+    csv_path = os.path.join(directory, f"{ticker.replace('.', '_')}_returns.csv")
+    returns_df = pd.read_csv(csv_path, index_col=0, parse_dates=True)
+    return returns_df["Returns"].dropna()
+
+def run_multi_asset_monte_carlo(returns_panel, n_simulations=10_000, horizon=252, initial_prices=None,
+                                weights=None, chunk_size=None, bins=50, seed=None, n_workers=1,
+                                dtype=np.float32):
+    """
+    Joint Monte Carlo of several assets with correlated normal returns.
+
+    The mean vector and covariance matrix are estimated from the aligned return
+    panel. Each chunk draws independent standard normals and correlates them with
+    a single matmul against the Cholesky factor, so only a (chunk_size x horizon x
+    n_assets) block ever exists in memory.
+
+    Parameters:
+    - returns_panel: DataFrame (dates x tickers) of aligned returns, e.g. from load_peer_returns.
+    - n_simulations: How many joint paths to run.
+    - horizon: Over how many 'days' each simulation runs.
+    - initial_prices: Starting price per asset; defaults to 1.0 (final value as a multiple of today's).
+    - weights: Portfolio value weights per asset; defaults to equal weights summing to 1.
+    - chunk_size: Paths per chunk; defaults to DEFAULT_CHUNK_SIZE split across the assets.
+    - bins: Number of fixed histogram bins.
+    - seed: Optional seed (int or np.random.SeedSequence) for reproducible results.
+    - n_workers: Number of worker processes; None or -1 uses every available core.
+    - dtype: Floating point type of the simulated returns (float32 halves the chunk memory).
+
+    Returns:
+    - dict with 'tickers', 'correlation' (DataFrame), 'assets' (ticker -> MonteCarloStats of
+      final price) and 'portfolio' (MonteCarloStats of final portfolio value, starting at 1.0).
+    """
+    tickers = list(returns_panel.columns)
+    n_assets = len(tickers)
+    returns = returns_panel.to_numpy(dtype=float)
+
+    mu = returns.mean(axis=0)
+    cov = np.cov(returns, rowvar=False, ddof=0)
+    chol = np.linalg.cholesky(cov)
+    sigma = np.sqrt(np.diag(cov))
+
+    initial_prices = np.ones(n_assets) if initial_prices is None else np.asarray(initial_prices, dtype=float)
+    weights = np.full(n_assets, 1.0 / n_assets) if weights is None else np.asarray(weights, dtype=float)
+    if chunk_size is None:
+        chunk_size = max(1, DEFAULT_CHUNK_SIZE // n_assets)
+
+    asset_edges = [histogram_edges(mu[i], sigma[i], horizon, initial_prices[i], bins) for i in range(n_assets)]
+    portfolio_edges = histogram_edges(weights @ mu, np.sqrt(weights @ cov @ weights), horizon, 1.0, bins)
+
+    chunk_sizes = _chunk_sizes(n_simulations, chunk_size)
+    chunk_seeds = _as_seed_sequence(seed).spawn(len(chunk_sizes))
+    tasks = [(mu, chol, n_paths, horizon, initial_prices, weights, asset_edges, portfolio_edges, chunk_seed, dtype)
+             for n_paths, chunk_seed in zip(chunk_sizes, chunk_seeds)]
+
+    asset_stats = [MonteCarloStats(edges) for edges in asset_edges]
+    portfolio_stats = MonteCarloStats(portfolio_edges)
+    for chunk_assets, chunk_portfolio in _map_chunks(_simulate_multi_asset_chunk_stats, tasks, n_workers):
+        for stats, chunk_stats in zip(asset_stats, chunk_assets):
+            stats.merge(chunk_stats)
+        portfolio_stats.merge(chunk_portfolio)
+
+    correlation = pd.DataFrame(cov / np.outer(sigma, sigma), index=tickers, columns=tickers)
+    return {
+        "tickers": tickers,
+        "correlation": correlation,
+        "assets": dict(zip(tickers, asset_stats)),
+        "portfolio": portfolio_stats,
+    }
+
+def _simulate_multi_asset_chunk_stats(task):
+    mu, chol, n_paths, horizon, initial_prices, weights, asset_edges, portfolio_edges, chunk_seed, dtype = task
+    rng = np.random.default_rng(chunk_seed)
+    n_assets = mu.size
+
+    # Correlate every (path, day) shock vector with one matmul, then add the drift
+    shocks = rng.standard_normal((n_paths * horizon, n_assets), dtype=dtype)
+    returns = shocks @ chol.T.astype(dtype)
+    returns += mu.astype(dtype)
+    returns += 1.0
+
+    # Compound over the horizon axis in float64 to keep the growth factors accurate
+    growth = np.prod(returns.reshape(n_paths, horizon, n_assets), axis=1, dtype=np.float64)
+    final_prices = growth * initial_prices
+    portfolio_values = growth @ weights
+
+    chunk_assets = [MonteCarloStats.from_values(final_prices[:, i], edges) for i, edges in enumerate(asset_edges)]
+    return chunk_assets, MonteCarloStats.from_values(portfolio_values, portfolio_edges)
+
+
+# ------------------ CALIBRATION BACKTEST ------------------
+# Central prediction intervals whose realised coverage the backtest reports
+COVERAGE_LEVELS = (0.5, 0.8, 0.9, 0.95)
+BACKTEST_MODELS = ("normal", "bootstrap")
+
+def run_calibration_backtest(returns, window=252, horizon=21, step=1, n_simulations=2000, model="normal",
+                             seed=None, n_workers=1, pit_bins=10, levels=COVERAGE_LEVELS):
+    """
+    Rolling-origin backtest of the simulated price distribution's calibration.
+
+    At every origin the model is fitted on the trailing `window` returns, the next
+    `horizon` days are simulated, and the realised growth over those days is
+    located in the simulated distribution (its probability integral transform,
+    PIT). A calibrated simulator gives uniform PITs, and a central a-interval
+    contains the realised price a of the time.
+
+    Nothing is refitted from scratch: window means and variances for the normal
+    model come from differences of cumulative sums, the bootstrap draws straight
+    from a sliding_window_view of the returns, and realised growth is a difference
+    of cumulative log returns. Origins are simulated in vectorized batches,
+    optionally on a process pool, each batch with its own spawned seed.
+
+    Parameters:
+    - returns: Series (or array) of historical returns, e.g. load_returns("EZJ.L").
+    - window: Trailing days used for each fit.
+    - horizon: Days ahead that are simulated and compared with what happened.
+    - step: Days between consecutive origins.
+    - n_simulations: Paths simulated per origin.
+    - model: One of BACKTEST_MODELS ('normal' fit or i.i.d. 'bootstrap' of the window).
+    - seed, n_workers: As for run_monte_carlo_streaming.
+    - pit_bins: Number of equal-width bins of the PIT histogram.
+    - levels: Central interval levels whose coverage is reported.
+
+    Returns:
+    - dict with 'pit' (Series indexed by origin date, or position for arrays),
+      'pit_histogram' (DataFrame of observed and expected counts per PIT bin) and
+      'coverage' (DataFrame of nominal vs realised coverage per level).
+    """
+    if model not in BACKTEST_MODELS:
+        raise ValueError(f"The backtest supports {list(BACKTEST_MODELS)}, not {model!r}")
+    index = returns.index if isinstance(returns, pd.Series) else None
+    r = np.asarray(returns, dtype=float)
+    n_origins = r.size - window - horizon + 1
+    if n_origins < 1:
+        raise ValueError(f"Need more than window + horizon = {window + horizon} returns, got {r.size}")
+    # Origin t fits on r[t - window:t] and is scored on r[t:t + horizon]
+    origins = np.arange(window, window + n_origins, step)
+
+    sums = np.concatenate([[0.0], np.cumsum(r)])
+    sq_sums = np.concatenate([[0.0], np.cumsum(r * r)])
+    mu = (sums[origins] - sums[origins - window]) / window
+    sigma = np.sqrt(np.maximum((sq_sums[origins] - sq_sums[origins - window]) / window - mu ** 2, 0.0))
+    log_growth = np.concatenate([[0.0], np.cumsum(np.log1p(r))])
+    realised = np.exp(log_growth[origins + horizon] - log_growth[origins])
+
+    # Origins per batch: about as many simulated days as a DEFAULT_CHUNK_SIZE x 252 chunk
+    batch = max(1, DEFAULT_CHUNK_SIZE * 252 // (n_simulations * horizon))
+    batches = [slice(start, start + batch) for start in range(0, origins.size, batch)]
+    batch_seeds = _as_seed_sequence(seed).spawn(len(batches))
+    windows = r if model == "bootstrap" else None
+    tasks = [(origins[b], mu[b], sigma[b], realised[b], windows, window, horizon, n_simulations, batch_seed)
+             for b, batch_seed in zip(batches, batch_seeds)]
+    pit = np.concatenate(list(_map_chunks(_backtest_batch, tasks, n_workers)))
+
+    counts, edges = np.histogram(pit, bins=pit_bins, range=(0.0, 1.0))
+    pit_histogram = pd.DataFrame({"Observed": counts, "Expected": np.full(pit_bins, pit.size / pit_bins)},
+                                 index=pd.IntervalIndex.from_breaks(np.round(edges, 6), name="PIT"))
+    coverage = pd.DataFrame(
+        {"Nominal": list(levels),
+         "Realised": [float(np.mean((pit >= (1 - a) / 2) & (pit <= (1 + a) / 2))) for a in levels]},
+        index=[f"{a:.0%}" for a in levels]
+    )
+    pit_index = index[origins] if index is not None else pd.Index(origins, name="Origin")
+    return {"pit": pd.Series(pit, index=pit_index, name="PIT"), "pit_histogram": pit_histogram,
+            "coverage": coverage}
+
+def run_peer_calibration_backtests(tickers=PEER_TICKERS, directory="attached_assets", **backtest_options):
+    """run_calibration_backtest on every ticker's own return history; returns dict ticker -> result"""
+    return {ticker: run_calibration_backtest(load_returns(ticker, directory), **backtest_options)
+            for ticker in tickers}
+
+def _backtest_batch(task):
+    origins, mu, sigma, realised, returns, window, horizon, n_simulations, batch_seed = task
+    rng = np.random.default_rng(batch_seed)
+    shape = (origins.size, n_simulations, horizon)
+    if returns is None:
+        growth = rng.standard_normal(shape)
+        growth *= sigma[:, None, None]
+        growth += 1.0 + mu[:, None, None]
+    else:
+        # Row t - window of the sliding view is exactly origin t's trailing window (no copy)
+        windows = np.lib.stride_tricks.sliding_window_view(returns, window)[origins - window]
+        growth = np.take_along_axis(windows[:, None, :], rng.integers(0, window, size=shape).reshape(origins.size, 1, -1),
+                                    axis=2).reshape(shape)
+        growth += 1.0
+    final = np.prod(growth, axis=2)
+    # Mid-rank PIT, so ties with the realised value count half
+    below = np.count_nonzero(final < realised[:, None], axis=1)
+    ties = np.count_nonzero(final == realised[:, None], axis=1)
+    return (below + 0.5 * ties) / n_simulations
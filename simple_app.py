@@ -2,9 +2,8 @@ import streamlit as st
 # Set page title
 st.set_page_config(page_title="EasyJet DCF Model", layout="wide")
 
-import pandas as pd
 import os
-from utils import load_excel_file
+from utils import default_workbook_cache, load_excel_file
 from dcf_analyzer import DCFAnalyzer
 
 
@@ -16,8 +15,8 @@ file_path = "attached_assets/EasyJet- complete.xlsx"
 if os.path.exists(file_path):
     st.info(f"Found Excel file: {file_path}")
     try:
-        # Load Excel file
-        excel_data = pd.read_excel(file_path, sheet_name=None)
+        # Load Excel file (sheets are parsed on first access)
+        excel_data, _ = load_excel_file(file_path, cache=default_workbook_cache())
 
         # Print available sheets
         st.write("Available sheets:", list(excel_data.keys()))
@@ -1,30 +1,143 @@
+import difflib
+import io
+import os
+import posixpath
+import threading
+import weakref
+import zipfile
+from collections.abc import Mapping
+
 import pandas as pd
 import numpy as np
 import streamlit as st
-from datetime import datetime
+from datetime import datetime, timedelta
+from xml.etree import ElementTree
+
+from disk_cache import CACHE_ROOT, NpzCache, content_key
+
+# Workbook snapshots: parsed sheets are stored as .npz files keyed by the SHA-256 of
+# the workbook bytes, so unchanged workbooks skip openpyxl entirely on later runs
+WORKBOOK_CACHE_DIR = os.path.join(CACHE_ROOT, "workbooks")
+WORKBOOK_SNAPSHOT_VERSION = 1
 
-def load_excel_file(uploaded_file):
+# Type codes of cells in object/string columns of a snapshot
+_CELL_NONE, _CELL_FLOAT, _CELL_INT, _CELL_BOOL, _CELL_STR, _CELL_DATETIME = range(6)
+
+def default_workbook_cache():
+    """The shared on-disk cache of parsed workbook sheets (WORKBOOK_CACHE_DIR, LRU-bounded in size)"""
+    return NpzCache(WORKBOOK_CACHE_DIR)
+
+class LazySheetDict(Mapping):
+    """
+    Read-only mapping of sheet name -> DataFrame that parses each sheet on first access
+
+    The sheet names are known up front, so membership tests, len() and iteration over
+    names are free; a sheet is only loaded the first time it is looked up and is kept
+    afterwards together with its label_index. With a cache, a sheet is read from its snapshot when there is one and
+    the workbook is only opened (via open_workbook) for sheets that still need parsing.
+    The workbook is closed again as soon as the sheet is parsed, so no file handle is held
+    between lookups.
+    """
+
+    def __init__(self, sheet_names, open_workbook, cache=None, workbook_key=None):
+        self._sheet_names = list(sheet_names)
+        self._open_workbook = open_workbook
+        self._cache = cache
+        self._workbook_key = workbook_key
+        self._sheets = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, sheet_name):
+        if sheet_name not in self._sheets:
+            if sheet_name not in self._sheet_names:
+                raise KeyError(sheet_name)
+            with self._lock:
+                if sheet_name not in self._sheets:
+                    self._sheets[sheet_name] = self._load_sheet(sheet_name)
+                    # Index the sheet's labels with it, for the label lookups of its readers
+                    label_index(self._sheets[sheet_name])
+        return self._sheets[sheet_name]
+
+    def _load_sheet(self, sheet_name):
+        if self._cache is None:
+            return self._parse_sheet(sheet_name)
+
+        sheet_key = content_key(self._workbook_key, sheet_name)
+        arrays = self._cache.get(sheet_key)
+        if arrays is not None:
+            return _frame_from_arrays(arrays)
+
+        df = self._parse_sheet(sheet_name)
+        try:
+            arrays = _frame_to_arrays(df)
+        except TypeError:
+            # Cells of a type the snapshot format doesn't cover; always parse this sheet
+            return df
+        self._cache.set(sheet_key, arrays)
+        return df
+
+    def _parse_sheet(self, sheet_name):
+        with self._open_workbook() as excel_file:
+            return excel_file.parse(sheet_name)
+
+    def __contains__(self, sheet_name):
+        return sheet_name in self._sheet_names
+
+    def __iter__(self):
+        return iter(self._sheet_names)
+
+    def __len__(self):
+        return len(self._sheet_names)
+
+    def loaded_sheets(self):
+        """Names of the sheets loaded so far"""
+        return [name for name in self._sheet_names if name in self._sheets]
+
+    def __repr__(self):
+        return f"LazySheetDict(sheets={self._sheet_names}, loaded={self.loaded_sheets()})"
+
+def load_excel_file(uploaded_file, cache=None):
     """
     Load Excel file and return a dictionary of DataFrames (one per sheet)
 
+    Sheets are parsed lazily: the workbook bytes are read once, opening the workbook
+    only reads its sheet names, and each sheet is parsed from the bytes the first time
+    it is accessed (see LazySheetDict).
+
     Args:
         uploaded_file: The uploaded Excel file or file path
+        cache: Optional NpzCache (e.g. default_workbook_cache()). Parsed sheets are
+            stored in it under the SHA-256 of the workbook bytes and reloaded from it
+            on later calls with the same workbook, whatever its name or origin
 
     Returns:
-        dict: Dictionary containing DataFrames for each sheet
+        LazySheetDict: Mapping of sheet name to DataFrame, parsed on first access
         str: Filename
     """
     try:
-        # Read all sheets into a dictionary of DataFrames
-        excel_file = pd.ExcelFile(uploaded_file)
-        df_dict = {sheet_name: excel_file.parse(sheet_name) for sheet_name in excel_file.sheet_names}
+        # Sheets are parsed on demand from the bytes, never from a workbook left open
+        data = _read_workbook_bytes(uploaded_file)
+        open_workbook = lambda: pd.ExcelFile(io.BytesIO(data))
+        if cache is None:
+            with open_workbook() as excel_file:
+                sheet_names = excel_file.sheet_names
+            df_dict = LazySheetDict(sheet_names, open_workbook)
+        else:
+            workbook_key = content_key("workbook", WORKBOOK_SNAPSHOT_VERSION, data)
+            manifest = cache.get(workbook_key)
+            if manifest is None:
+                with open_workbook() as excel_file:
+                    sheet_names = excel_file.sheet_names
+                cache.set(workbook_key, {"sheet_names": np.array(sheet_names, dtype=str)})
+            else:
+                sheet_names = manifest["sheet_names"].tolist()
+            df_dict = LazySheetDict(sheet_names, open_workbook, cache, workbook_key)
 
         # Handle both file objects and path strings
         if hasattr(uploaded_file, 'name'):
             filename = uploaded_file.name
         else:
             # For a string path, extract just the filename
-            import os
             filename = os.path.basename(str(uploaded_file))
 
         return df_dict, filename
@@ -32,6 +145,632 @@ def load_excel_file(uploaded_file):
         st.error(f"Error reading Excel file: {str(e)}")
         return None, None
 
+def _read_workbook_bytes(source):
+    """Raw bytes of a workbook given as a path or a file object (left at its start position)"""
+    if hasattr(source, "getvalue"):
+        return source.getvalue()
+    if hasattr(source, "read"):
+        position = source.tell()
+        data = source.read()
+        source.seek(position)
+        return data
+    with open(source, "rb") as f:
+        return f.read()
+
+def _frame_to_arrays(df):
+    """
+    Encode a parsed sheet as a dict of plain numpy arrays for NpzCache
+
+    Numeric, bool and datetime64 columns are stored as they are. Object and string
+    columns, which mix floats, ints, text and dates cell by cell, are stored together
+    as one block: a type code per cell plus a compact array per type holding only
+    the cells of that type, with text as concatenated UTF-8 bytes and their lengths.
+    Raises TypeError for cells of any other type (e.g. times of day).
+    """
+    dtypes = [str(dtype) for dtype in df.dtypes]
+    raw_columns = [i for i, dtype in enumerate(df.dtypes)
+                   if isinstance(dtype, np.dtype) and dtype.kind in "biufcmM"]
+    block_columns = [i for i, dtype in enumerate(df.dtypes)
+                     if dtype == object or dtypes[i] == "str"]
+    if (len(raw_columns) + len(block_columns) != df.shape[1] or df.shape[1] == 0
+            or not isinstance(df.index, pd.RangeIndex)):
+        raise TypeError("unsupported column dtype or index")
+
+    arrays = {
+        "dtypes": np.array(dtypes, dtype=str),
+        "columns_dtype": np.array(str(df.columns.dtype)),
+        "raw_columns": np.array(raw_columns, dtype=np.int64),
+        "block_columns": np.array(block_columns, dtype=np.int64),
+        "n_rows": np.array(len(df), dtype=np.int64),
+    }
+    arrays.update(_encode_cells(np.asarray(df.columns, dtype=object), "names_"))
+    for i in raw_columns:
+        arrays[f"raw_{i}"] = df.iloc[:, i].to_numpy()
+    arrays.update(_encode_cells(df.iloc[:, block_columns].to_numpy(dtype=object).ravel(), "block_"))
+    return arrays
+
+def _frame_from_arrays(arrays):
+    """Rebuild a sheet encoded by _frame_to_arrays"""
+    dtypes = arrays["dtypes"].tolist()
+    n_rows = int(arrays["n_rows"])
+    names = _decode_cells(arrays, "names_")
+    block_columns = arrays["block_columns"].tolist()
+    block = _decode_cells(arrays, "block_").reshape(n_rows, len(block_columns))
+
+    columns = {}
+    for i in arrays["raw_columns"].tolist():
+        columns[i] = pd.Series(arrays[f"raw_{i}"], copy=False)
+    for j, i in enumerate(block_columns):
+        columns[i] = pd.Series(block[:, j], dtype=dtypes[i])
+    df = pd.concat([columns[i] for i in range(len(names))], axis=1, ignore_index=True)
+    df.columns = pd.Index(names, dtype=str(arrays["columns_dtype"]))
+    return df
+
+def _encode_cells(values, prefix):
+    """Type codes and per-type value arrays of a 1-d object array (see _frame_to_arrays)"""
+    codes = np.empty(len(values), dtype=np.uint8)
+    floats, ints, bools, texts, dates = [], [], [], [], []
+    for k, value in enumerate(values):
+        if value is None:
+            codes[k] = _CELL_NONE
+        elif isinstance(value, bool):
+            codes[k] = _CELL_BOOL
+            bools.append(value)
+        elif isinstance(value, float):
+            codes[k] = _CELL_FLOAT
+            floats.append(value)
+        elif isinstance(value, int):
+            codes[k] = _CELL_INT
+            ints.append(value)
+        elif isinstance(value, str):
+            codes[k] = _CELL_STR
+            texts.append(value.encode("utf-8", "surrogatepass"))
+        elif isinstance(value, datetime) and value.tzinfo is None and not isinstance(value, pd.Timestamp):
+            codes[k] = _CELL_DATETIME
+            dates.append(value)
+        else:
+            raise TypeError(f"unsupported cell type {type(value).__name__}")
+
+    return {
+        prefix + "codes": codes,
+        prefix + "floats": np.array(floats, dtype=np.float64),
+        prefix + "ints": np.array(ints, dtype=np.int64),
+        prefix + "bools": np.array(bools, dtype=bool),
+        prefix + "text": np.frombuffer(b"".join(texts), dtype=np.uint8),
+        prefix + "text_lengths": np.array([len(text) for text in texts], dtype=np.int64),
+        prefix + "dates": np.array(dates, dtype="datetime64[us]"),
+    }
+
+def _decode_cells(arrays, prefix):
+    """Inverse of _encode_cells"""
+    codes = arrays[prefix + "codes"]
+    values = np.full(len(codes), None, dtype=object)
+    values[codes == _CELL_FLOAT] = arrays[prefix + "floats"].tolist()
+    values[codes == _CELL_INT] = arrays[prefix + "ints"].tolist()
+    values[codes == _CELL_BOOL] = arrays[prefix + "bools"].tolist()
+    values[codes == _CELL_DATETIME] = arrays[prefix + "dates"].tolist()
+
+    text = arrays[prefix + "text"].tobytes()
+    ends = np.cumsum(arrays[prefix + "text_lengths"]).tolist()
+    values[codes == _CELL_STR] = [text[start:end].decode("utf-8", "surrogatepass")
+                                  for start, end in zip([0] + ends[:-1], ends)]
+    return values
+
+# ------------------ LABEL INDEX ------------------
+# Label indexes of the DataFrames seen by label_index, by id (DataFrames aren't hashable);
+# an entry is dropped when its DataFrame is garbage collected
+_LABEL_INDEXES = {}
+
+def normalize_label(text):
+    """Case- and whitespace-insensitive form of a label: casefolded, runs of whitespace collapsed"""
+    return " ".join(str(text).casefold().split())
+
+class LabelIndex:
+    """
+    Inverted index of the text cells of a sheet: normalized label -> (row, col) positions
+
+    Built in one pass over the sheet. Looking up a label returns the positions of every
+    cell whose normalized text contains the normalized label, in row-major order; the
+    scan over the distinct labels of the sheet happens once per query, after which the
+    query is answered from a dict. Matching is literal (not a regular expression) and
+    ignores case and extra whitespace; closest() adds fuzzy matching for misspelt or
+    reworded labels.
+    """
+
+    def __init__(self, texts, positions):
+        """
+        Args:
+            texts: Cell texts
+            positions: (row, col) of each text, in the same order
+        """
+        self._positions = {}
+        for label, position in zip(texts, positions):
+            self._positions.setdefault(normalize_label(label), []).append(tuple(position))
+        for cells in self._positions.values():
+            cells.sort()
+        self._matches = {}
+
+    @classmethod
+    def from_frame(cls, df):
+        """Index of the string cells of a DataFrame, positioned by (iloc row, iloc col)"""
+        values = pd.Series(df.to_numpy(dtype=object).ravel())
+        texts = values[values.map(type).eq(str).to_numpy()]
+        rows, cols = np.divmod(texts.index.to_numpy(), max(df.shape[1], 1))
+        normalized = texts.str.casefold().str.split().str.join(" ")
+        return cls(normalized.tolist(), zip(rows.tolist(), cols.tolist()))
+
+    def __len__(self):
+        return len(self._positions)
+
+    def positions(self, text):
+        """(row, col) of every cell containing the label, in row-major order"""
+        query = normalize_label(text)
+        if query not in self._matches:
+            cells = [cell for label, label_cells in self._positions.items() if query in label
+                     for cell in label_cells]
+            self._matches[query] = sorted(cells)
+        return self._matches[query]
+
+    def find(self, text):
+        """(row, col) of the first cell containing the label, or None"""
+        cells = self.positions(text)
+        return cells[0] if cells else None
+
+    def find_row(self, text):
+        """First row with a cell containing the label, or None"""
+        cell = self.find(text)
+        return None if cell is None else cell[0]
+
+    def closest(self, text, cutoff=0.8):
+        """
+        (row, col) of the first cell containing the label or, failing that, of the cell
+        whose text is most similar to it (difflib ratio of at least cutoff); None if none is
+        """
+        cell = self.find(text)
+        if cell is not None:
+            return cell
+        key = (normalize_label(text), cutoff)
+        if key not in self._matches:
+            match = difflib.get_close_matches(key[0], list(self._positions), n=1, cutoff=cutoff)
+            self._matches[key] = self._positions[match[0]] if match else []
+        cells = self._matches[key]
+        return cells[0] if cells else None
+
+def label_index(df):
+    """
+    The LabelIndex of a sheet's DataFrame, built on first use and kept while the
+    DataFrame is alive, so every lookup on the same sheet shares one index. Sheets are
+    treated as read-only: an index is not rebuilt if its DataFrame is modified in place.
+    """
+    entry = _LABEL_INDEXES.get(id(df))
+    if entry is not None and entry[0]() is df:
+        return entry[1]
+    index = LabelIndex.from_frame(df)
+    _LABEL_INDEXES[id(df)] = (weakref.ref(df), index)
+    weakref.finalize(df, _LABEL_INDEXES.pop, id(df), None)
+    return index
+
+# ------------------ TARGETED CELL READER ------------------
+# Cell kinds of a cell map: how the raw cell value is converted
+CELL_KINDS = {
+    "numeric": "Number (text such as '£1,234' or '10.2%' is parsed, missing -> 0)",
+    "date": "Date as 'YYYY-MM-DD' (Excel serial numbers are converted, missing -> today)",
+    "text": "Text (missing -> '')",
+    "raw": "Value as stored in the sheet (missing -> None; dates read from a workbook stay serial numbers)",
+}
+
+_EXCEL_EPOCHS = {False: datetime(1899, 12, 30), True: datetime(1904, 1, 1)}
+
+def read_cells(source, cell_map, sheet_name="DCF"):
+    """
+    Read a handful of cells from one sheet of an .xlsx workbook without parsing it
+
+    The workbook is opened as a zip archive and only the target sheet's XML is
+    streamed, row by row, stopping after the last requested row; shared strings are
+    only read as far as the requested cells need. Values are the cached results of
+    formulas, as Excel last saved them. A requested cell that is empty and has a label
+    is looked up instead in the first row containing that label (see LabelIndex), in
+    the same column, which costs one full pass over the sheet.
+
+    Args:
+        source: Path or file object of the .xlsx workbook
+        cell_map: Extraction schema, i.e. dict of field -> (address, kind[, label[, default]]),
+            e.g. {"wacc": ("E17", "numeric", "Discount Rate (WACC)", 0.1)}; see compile_schema
+        sheet_name: Name of the sheet to read
+
+    Returns:
+        dict: Field -> typed value
+    """
+    return compile_schema(cell_map).extract(source, sheet_name)
+
+def _read_raw_cells(source, sheet_name, positions, labels, date_fields):
+    """
+    Raw values of the cells of one sheet of an .xlsx workbook (see read_cells)
+
+    Args:
+        source: Path or file object of the .xlsx workbook
+        sheet_name: Name of the sheet to read
+        positions: Dict of field -> (row, col), both 1-based
+        labels: Dict of field -> label of the row to fall back to when the cell is empty
+        date_fields: Fields whose numbers are Excel date serials, returned as datetimes
+
+    Returns:
+        dict: Field -> raw value (number, bool, text, datetime or None)
+    """
+    wanted = dict(positions)
+    with zipfile.ZipFile(source) as archive:
+        sheet_path, shared_strings_path, date1904 = _locate_sheet(archive, sheet_name)
+        last_row = max(row for row, _ in wanted.values())
+        cells = _stream_sheet_cells(archive, sheet_path, set(wanted.values()), last_row)
+
+        labelled = {field: label for field, label in labels.items() if cells.get(wanted[field]) is None}
+        if labelled:
+            all_cells = _stream_sheet_cells(archive, sheet_path, None, None)
+            texts = {position: value for position, value
+                     in _resolve_shared_strings(archive, shared_strings_path, all_cells).items()
+                     if isinstance(value, str)}
+            index = LabelIndex(texts.values(), texts.keys())
+            label_rows = {field: index.find_row(label) for field, label in labelled.items()}
+            for field, row in label_rows.items():
+                if row is None:
+                    continue
+                wanted[field] = (row, wanted[field][1])
+                cells[wanted[field]] = all_cells.get(wanted[field])
+
+        values = _resolve_shared_strings(archive, shared_strings_path, {position: cells.get(position) for position in wanted.values()})
+
+    epoch = _EXCEL_EPOCHS[date1904]
+    result = {}
+    for field, position in wanted.items():
+        value = values[position]
+        if field in date_fields and isinstance(value, (int, float)) and not isinstance(value, bool):
+            value = epoch + timedelta(days=value)
+        result[field] = value
+    return result
+
+def _cell_position(address):
+    """(row, column) of an A1-style address, both 1-based, e.g. 'K19' -> (19, 11)"""
+    address = address.replace("$", "").upper()
+    split = len(address) - len(address.lstrip("ABCDEFGHIJKLMNOPQRSTUVWXYZ"))
+    if split == 0 or not address[split:].isdigit():
+        raise ValueError(f"Invalid cell address '{address}'")
+    col = 0
+    for letter in address[:split]:
+        col = col * 26 + ord(letter) - ord("A") + 1
+    return int(address[split:]), col
+
+def _xml_name(tag):
+    """Tag or attribute name without its namespace"""
+    return tag.rsplit("}", 1)[-1]
+
+def _locate_sheet(archive, sheet_name):
+    """
+    Archive paths of a sheet's XML and of the shared strings (None if there are none),
+    and whether the workbook uses the 1904 date system
+    """
+    workbook_path = "xl/workbook.xml"
+    for rel in ElementTree.fromstring(archive.read("_rels/.rels")):
+        if rel.get("Type", "").endswith("/officeDocument"):
+            workbook_path = rel.get("Target").lstrip("/")
+    workbook_dir = posixpath.dirname(workbook_path)
+    rels_path = posixpath.join(workbook_dir, "_rels", posixpath.basename(workbook_path) + ".rels")
+    targets = {}
+    shared_strings_path = None
+    for rel in ElementTree.fromstring(archive.read(rels_path)):
+        target = rel.get("Target")
+        target = target.lstrip("/") if target.startswith("/") else posixpath.normpath(posixpath.join(workbook_dir, target))
+        targets[rel.get("Id")] = target
+        if rel.get("Type", "").endswith("/sharedStrings"):
+            shared_strings_path = target
+
+    date1904 = False
+    for element in ElementTree.fromstring(archive.read(workbook_path)).iter():
+        name = _xml_name(element.tag)
+        if name == "workbookPr":
+            date1904 = element.get("date1904", "0").lower() in ("1", "true")
+        elif name == "sheet" and element.get("name") == sheet_name:
+            rel_id = next(value for key, value in element.attrib.items() if _xml_name(key) == "id")
+            return targets[rel_id], shared_strings_path, date1904
+    raise KeyError(f"Worksheet '{sheet_name}' not found in the workbook")
+
+def _stream_sheet_cells(archive, sheet_path, positions, last_row):
+    """
+    Raw values of the cells of a sheet at the given (row, col) positions (all cells if
+    positions is None), parsing rows only up to last_row (None for all rows).
+
+    Shared strings are returned as ("shared", index) placeholders (see _resolve_shared_strings).
+    """
+    cells = {}
+    with archive.open(sheet_path) as xml:
+        for _, element in ElementTree.iterparse(xml, events=("end",)):
+            name = _xml_name(element.tag)
+            if name != "row":
+                if name == "sheetData":
+                    break
+                continue
+
+            row = int(element.get("r"))
+            if last_row is not None and row > last_row:
+                break
+            next_col = 1
+            for cell in element:
+                if _xml_name(cell.tag) != "c":
+                    continue
+                reference = cell.get("r")
+                col = _cell_position(reference)[1] if reference else next_col
+                next_col = col + 1
+                if positions is None or (row, col) in positions:
+                    cells[row, col] = _cell_value(cell)
+            element.clear()
+            if last_row is not None and row == last_row:
+                break
+    return cells
+
+def _cell_value(cell):
+    """Raw value of a <c> element: number, bool, text, ("shared", index) or None"""
+    cell_type = cell.get("t", "n")
+    value = text = None
+    for child in cell:
+        name = _xml_name(child.tag)
+        if name == "v":
+            value = child.text
+        elif name == "is":
+            text = _rich_text(child)
+    if cell_type == "inlineStr":
+        return text
+    if value is None:
+        return None
+    if cell_type == "s":
+        return ("shared", int(value))
+    if cell_type == "b":
+        return value == "1"
+    if cell_type in ("str", "e"):
+        return value
+    if cell_type == "d":
+        return pd.to_datetime(value).to_pydatetime()
+    number = float(value)
+    return int(number) if number.is_integer() and "." not in value and "E" not in value.upper() else number
+
+def _rich_text(element):
+    """Text of an <si> or <is> element: plain <t> or concatenated rich text runs, without phonetic hints"""
+    parts = []
+    for child in element:
+        name = _xml_name(child.tag)
+        if name == "t":
+            parts.append(child.text or "")
+        elif name == "r":
+            parts.extend(t.text or "" for t in child if _xml_name(t.tag) == "t")
+    return "".join(parts)
+
+def _resolve_shared_strings(archive, shared_strings_path, cells):
+    """Replace ("shared", index) placeholders by their text, reading only as far as needed"""
+    indices = {value[1] for value in cells.values() if isinstance(value, tuple)}
+    if not indices or shared_strings_path is None:
+        return cells
+
+    strings = {}
+    last = max(indices)
+    with archive.open(shared_strings_path) as xml:
+        index = 0
+        for _, element in ElementTree.iterparse(xml, events=("end",)):
+            if _xml_name(element.tag) != "si":
+                continue
+            if index in indices:
+                strings[index] = _rich_text(element)
+            element.clear()
+            if index == last:
+                break
+            index += 1
+    return {position: strings.get(value[1]) if isinstance(value, tuple) else value
+            for position, value in cells.items()}
+
+# ------------------ EXTRACTION SCHEMA ------------------
+# Headline variables of the DCF tab: field -> (cell, kind, label of the cell's row to fall
+# back to if the cell is empty, default if neither gives a value)
+DCF_SCHEMA = {
+    "wacc": ("E17", "numeric", "Discount Rate (WACC)", 0.1),
+    "terminal_growth": ("K19", "numeric", "Implied Terminal FCF Growth Rate", 0.02),
+    "valuation_date": ("E11", "date", "Valuation Date", None),
+    "current_share_price": ("E14", "numeric", "Current Share Price", 0),
+    "diluted_shares_outstanding": ("E15", "numeric", "Diluted Shares Outstanding", 0),
+    "ev_multiples": ("K24", "numeric", "Implied Enterprise Value", 0),
+    "ev_perpetuity": ("P24", "numeric", "Implied Enterprise Value", 0),
+    "share_price_multiples": ("K39", "numeric", "Implied Share Price", 0),
+    "share_price_perpetuity": ("P39", "numeric", "Implied Share Price", 0),
+}
+
+# Placeholder variables used when the DCF tab can't be read at all (valuation_date is today)
+DCF_FALLBACK_VARIABLES = {
+    "wacc": 0.1,
+    "terminal_growth": 0.02,
+    "current_share_price": 5.0,
+    "diluted_shares_outstanding": 1000,
+    "ev_multiples": 5000,
+    "ev_perpetuity": 5500,
+    "share_price_multiples": 6.0,
+    "share_price_perpetuity": 6.5,
+}
+
+class CompiledSchema:
+    """
+    Extractor of the fields of an extraction schema (see compile_schema)
+
+    Cell addresses are resolved once, into the positions of the cells in a sheet's
+    DataFrame (Excel row n is DataFrame row n - 2, the first row being the header)
+    and in the workbook XML. Extracting gathers every field's cell from the sheet's
+    values array in one indexing step, falls back to the sheet's LabelIndex for the
+    empty ones, and converts each kind in bulk with parse_numeric_array and
+    parse_date_array; extract_many does the same for many sheets at once.
+    """
+
+    def __init__(self, schema):
+        self.fields = list(schema)
+        self.kinds, self.labels, self.defaults, cells = {}, {}, {}, {}
+        for field, entry in schema.items():
+            address, kind = entry[0], entry[1]
+            if kind not in CELL_KINDS:
+                raise ValueError(f"Unknown cell kind '{kind}' for '{field}'; expected one of {list(CELL_KINDS)}")
+            self.kinds[field] = kind
+            if len(entry) > 2 and entry[2]:
+                self.labels[field] = entry[2]
+            self.defaults[field] = entry[3] if len(entry) > 3 else None
+            cells[field] = _cell_position(address)
+        self.cells = cells
+        self._rows = np.array([cells[field][0] - 2 for field in self.fields], dtype=np.int64)
+        self._cols = np.array([cells[field][1] - 1 for field in self.fields], dtype=np.int64)
+        self._label_fields = [i for i, field in enumerate(self.fields) if field in self.labels]
+
+    def extract(self, source, sheet_name="DCF"):
+        """
+        Fields of one sheet
+
+        Args:
+            source: DataFrame of the sheet, a mapping of sheet name -> DataFrame (e.g. the
+                df_dict of load_excel_file), or the path or file object of an .xlsx workbook,
+                whose cells are then streamed with read_cells' reader without parsing the sheet
+            sheet_name: Sheet to read from a mapping or workbook
+
+        Returns:
+            dict: Field -> typed value
+        """
+        return self._convert(self._raw_values(source, sheet_name)[np.newaxis, :])[0]
+
+    def extract_many(self, sources, sheet_name="DCF"):
+        """
+        Fields of many sheets or workbooks, converted together
+
+        Args:
+            sources: Dict of name -> source, or a list of sources (see extract)
+            sheet_name: Sheet to read from mappings and workbooks
+
+        Returns:
+            pd.DataFrame: One row per source (indexed by its name or position), one column per field
+        """
+        names = list(sources) if isinstance(sources, Mapping) else range(len(sources))
+        items = sources.values() if isinstance(sources, Mapping) else sources
+        raw = np.empty((len(names), len(self.fields)), dtype=object)
+        for i, source in enumerate(items):
+            raw[i] = self._raw_values(source, sheet_name)
+        return pd.DataFrame(self._convert(raw), index=list(names), columns=self.fields)
+
+    def _raw_values(self, source, sheet_name):
+        """Raw cell values of the fields, as a 1-d object array"""
+        if isinstance(source, Mapping):
+            source = source[sheet_name]
+        if not isinstance(source, pd.DataFrame):
+            date_fields = {field for field, kind in self.kinds.items() if kind == "date"}
+            values = _read_raw_cells(source, sheet_name, self.cells, self.labels, date_fields)
+            raw = np.empty(len(self.fields), dtype=object)
+            raw[:] = [values[field] for field in self.fields]
+            return raw
+
+        values = source.to_numpy(dtype=object)
+        raw = np.full(len(self.fields), None, dtype=object)
+        inside = (self._rows >= 0) & (self._rows < values.shape[0]) & (self._cols < values.shape[1])
+        raw[inside] = values[self._rows[inside], self._cols[inside]]
+
+        missing = [i for i in self._label_fields if pd.isna(raw[i])]
+        if missing:
+            index = label_index(source)
+            for i in missing:
+                row = index.find_row(self.labels[self.fields[i]])
+                if row is not None and self._cols[i] < values.shape[1]:
+                    raw[i] = values[row, self._cols[i]]
+        return raw
+
+    def _convert(self, raw):
+        """Typed values of a (sources, fields) array of raw values, as one dict per source"""
+        fallback = {
+            "numeric": 0,
+            "date": datetime.now().strftime("%Y-%m-%d"),
+            "text": "",
+            "raw": None,
+        }
+        columns = {}
+        for kind in CELL_KINDS:
+            indices = [j for j, field in enumerate(self.fields) if self.kinds[field] == kind]
+            if not indices:
+                continue
+            block = raw[:, indices].ravel()
+            if kind == "numeric":
+                values = [None if np.isnan(value) else value for value in parse_numeric_array(block).tolist()]
+            elif kind == "date":
+                values = parse_date_array(block)
+            elif kind == "text":
+                values = [None if pd.isna(value) else str(value) for value in block]
+            else:
+                values = [None if pd.isna(value) else value for value in block]
+
+            # block is row-major, so a field's values are every len(indices)-th value
+            for k, j in enumerate(indices):
+                field = self.fields[j]
+                default = fallback[kind] if self.defaults[field] is None else self.defaults[field]
+                columns[field] = [default if value is None else value for value in values[k::len(indices)]]
+        return [{field: columns[field][i] for field in self.fields} for i in range(raw.shape[0])]
+
+def compile_schema(schema):
+    """
+    Compile an extraction schema into a CompiledSchema
+
+    Args:
+        schema: Dict of field -> (address, kind[, label[, default]]), where address is the
+            A1-style cell address in Excel (e.g. "E17"), kind a key of CELL_KINDS (how the
+            cell value is converted), label the text of the row to read instead (same
+            column) when the cell is empty, and default the value when neither gives one
+            (None for the kind's own fallback)
+
+    Returns:
+        CompiledSchema: The compiled extractor
+    """
+    return CompiledSchema(schema)
+
+def parse_numeric_array(values):
+    """
+    parse_numeric over many values at once
+
+    Numbers are taken as they are; text has currency symbols and thousands separators
+    stripped, and is divided by 100 if it has a percent sign ('£1,234' -> 1234.0,
+    '10.2%' -> 0.102), all with vectorized string operations.
+
+    Args:
+        values: Sequence of cell values
+
+    Returns:
+        np.ndarray: float64 values, NaN where a value is missing or not numeric
+    """
+    values = pd.Series(np.asarray(values, dtype=object).ravel(), dtype=object)
+    types = values.map(type)
+    is_text = types.map(lambda t: issubclass(t, str)).to_numpy(dtype=bool)
+    is_number = types.map(lambda t: issubclass(t, (int, float, np.number))).to_numpy(dtype=bool)
+
+    result = np.full(len(values), np.nan)
+    result[is_number] = values[is_number].to_numpy(dtype=float)
+    if is_text.any():
+        text = values[is_text].astype(str).str.replace(r"[$£€,]", "", regex=True)
+        percent = text.str.contains("%", regex=False).to_numpy(dtype=bool)
+        parsed = pd.to_numeric(text.str.replace("%", "", regex=False).str.strip(),
+                               errors="coerce").to_numpy(dtype=float)
+        result[is_text] = np.where(percent, parsed / 100, parsed)
+    return result
+
+def parse_date_array(values):
+    """
+    parse_date over many values at once
+
+    Args:
+        values: Sequence of cell values (datetimes or date text; numbers aren't dates)
+
+    Returns:
+        list: 'YYYY-MM-DD' strings, None where a value is missing or not a date
+    """
+    values = pd.Series(np.asarray(values, dtype=object).ravel(), dtype=object)
+    is_date = values.map(lambda v: isinstance(v, (datetime, str))).to_numpy(dtype=bool)
+    dates = pd.to_datetime(values.where(is_date), errors="coerce", format="mixed")
+    return [None if pd.isna(date) else date for date in dates.dt.strftime("%Y-%m-%d")]
+
+# Compiled extractor of DCF_SCHEMA, shared by extract_dcf_variables and DCFAnalyzer
+DCF_EXTRACTOR = compile_schema(DCF_SCHEMA)
+
 def extract_dcf_variables(df):
     """
     Extract DCF variables from specific cells in the DataFrame
@@ -40,98 +779,28 @@ def extract_dcf_variables(df):
         df: DataFrame containing the DCF tab data
 
     Returns:
-        dict: Dictionary of extracted DCF variables
+        dict: Dictionary of extracted DCF variables (DCF_SCHEMA), with the terminal growth
+        rate also under its former key 'terminal_fcf_growth_rate'
     """
     try:
-        # The cells might be 0-indexed in pandas vs 1-indexed in Excel
-        # We'll try both approaches in case of issues
-
-        # First attempt - direct Excel coordinates (0-indexed)
-        try:
-            # Excel cell E17 -> row 16, column 4 in 0-indexed DataFrame
-            wacc = extract_numeric_value(df, 16, 4)
-
-            # Excel cell K19 -> row 18, column 10 in 0-indexed DataFrame
-            terminal_fcf_growth_rate = extract_numeric_value(df, 18, 10)
-
-            # Excel cell E11 -> row 10, column 4
-            valuation_date = extract_date_value(df, 10, 4)
-
-            # Excel cell E14 -> row 13, column 4
-            current_share_price = extract_numeric_value(df, 13, 4)
-
-            # Excel cell E15 -> row 14, column 4
-            diluted_shares_outstanding = extract_numeric_value(df, 14, 4)
-
-            # Excel cell K24 -> row 23, column 10
-            ev_multiples = extract_numeric_value(df, 23, 10)
-
-            # Excel cell P24 -> row 23, column 15
-            ev_perpetuity = extract_numeric_value(df, 23, 15)
-
-            # Excel cell K39 -> row 38, column 10
-            share_price_multiples = extract_numeric_value(df, 38, 10)
-
-            # Excel cell P39 -> row 38, column 15
-            share_price_perpetuity = extract_numeric_value(df, 38, 15)
-
-        except Exception as e:
-            # Alternative attempt - try searching for cells by header values if direct access fails
-            st.warning(f"Attempting alternative cell extraction method due to: {str(e)}")
-
-            # Search for cell values by looking for headers and relative positions
-            wacc_row = locate_row_with_text(df, "Discount Rate (WACC)")
-            terminal_growth_row = locate_row_with_text(df, "Implied Terminal FCF Growth Rate")
-            valuation_date_row = locate_row_with_text(df, "Valuation Date")
-            share_price_row = locate_row_with_text(df, "Current Share Price")
-            shares_outstanding_row = locate_row_with_text(df, "Diluted Shares Outstanding")
-            ev_row = locate_row_with_text(df, "Implied Enterprise Value")
-            implied_share_row = locate_row_with_text(df, "Implied Share Price")
-
-            # Extract values based on relative positions
-            wacc = extract_numeric_from_row(df, wacc_row, 4) if wacc_row is not None else 0.1  # Default 10%
-            terminal_fcf_growth_rate = extract_numeric_from_row(df, terminal_growth_row, 10) if terminal_growth_row is not None else 0.02  # Default 2%
-            valuation_date = extract_date_from_row(df, valuation_date_row, 4) if valuation_date_row is not None else datetime.now().strftime("%Y-%m-%d")
-            current_share_price = extract_numeric_from_row(df, share_price_row, 4) if share_price_row is not None else 0
-            diluted_shares_outstanding = extract_numeric_from_row(df, shares_outstanding_row, 4) if shares_outstanding_row is not None else 0
-
-            # Enterprise values and implied share prices could be in multiple rows, find the right one
-            ev_multiples = extract_numeric_from_row(df, ev_row, 10) if ev_row is not None else 0
-            ev_perpetuity = extract_numeric_from_row(df, ev_row, 15) if ev_row is not None else 0
-            share_price_multiples = extract_numeric_from_row(df, implied_share_row, 10) if implied_share_row is not None else 0
-            share_price_perpetuity = extract_numeric_from_row(df, implied_share_row, 15) if implied_share_row is not None else 0
-
-        return {
-            'wacc': wacc,
-            'terminal_fcf_growth_rate': terminal_fcf_growth_rate,
-            'valuation_date': valuation_date,
-            'current_share_price': current_share_price,
-            'diluted_shares_outstanding': diluted_shares_outstanding,
-            'ev_multiples': ev_multiples,
-            'ev_perpetuity': ev_perpetuity,
-            'share_price_multiples': share_price_multiples,
-            'share_price_perpetuity': share_price_perpetuity
-        }
-
+        variables = DCF_EXTRACTOR.extract(df)
     except Exception as e:
         st.error(f"Error extracting DCF variables: {str(e)}")
         # Return reasonable defaults for sensitivity analysis
-        return {
-            'wacc': 0.1,  # 10%
-            'terminal_fcf_growth_rate': 0.02,  # 2%
-            'valuation_date': datetime.now().strftime("%Y-%m-%d"),
-            'current_share_price': 5.0,
-            'diluted_shares_outstanding': 1000,
-            'ev_multiples': 5000,
-            'ev_perpetuity': 5500,
-            'share_price_multiples': 6.0,
-            'share_price_perpetuity': 6.5
-        }
+        variables = dict(DCF_FALLBACK_VARIABLES, valuation_date=datetime.now().strftime("%Y-%m-%d"))
+    variables['terminal_fcf_growth_rate'] = variables['terminal_growth']
+    return variables
 
 def extract_numeric_value(df, row, col):
     """Extract a numeric value from a specific cell, handling different formats"""
-    value = df.iloc[row, col]
+    return parse_numeric(df.iloc[row, col])
+
+def extract_date_value(df, row, col):
+    """Extract a date value from a specific cell, handling different formats"""
+    return parse_date(df.iloc[row, col])
 
+def parse_numeric(value):
+    """Numeric value of a cell: numbers as is, text like '£1,234' or '10.2%' parsed, else 0"""
     if pd.isna(value):
         return 0
 
@@ -155,10 +824,8 @@ def extract_numeric_value(df, row, col):
     except:
         return 0
 
-def extract_date_value(df, row, col):
-    """Extract a date value from a specific cell, handling different formats"""
-    value = df.iloc[row, col]
-
+def parse_date(value):
+    """Date of a cell as 'YYYY-MM-DD', falling back to today's date"""
     if pd.isna(value):
         return datetime.now().strftime("%Y-%m-%d")
 
@@ -175,12 +842,8 @@ def extract_date_value(df, row, col):
         return datetime.now().strftime("%Y-%m-%d")
 
 def locate_row_with_text(df, text):
-    """Find row index containing the specified text"""
-    for i in range(len(df)):
-        row_values = df.iloc[i].astype(str).str.contains(text, case=False, na=False)
-        if any(row_values):
-            return i
-    return None
+    """Find row index containing the specified text (see LabelIndex for the matching rules)"""
+    return label_index(df).find_row(text)
 
 def extract_numeric_from_row(df, row, col):
     """Extract numeric value from specified row and column"""